@@ -10,21 +10,59 @@ st.set_page_config(
 ##### classes #####
 from db import Database
 from model import HousePricePredictor
+from registry import ModelRegistry
+from snapshot import ListingsSnapshot
+from store import ListingsStore
 
+import numpy as np
 import pandas as pd
-import plotly.express as px
+from charts import box_figure
+from geo import load_region_geojson
+from scraper import ImageCache
 
 import folium
-from folium.plugins import MarkerCluster
+from folium.plugins import FastMarkerCluster
 from streamlit_folium import folium_static
-import time
+from timing import latency
 import os
 
 import logging
-from utils import formatPrice, convert_to_eur, add_eur_price, update_currency
+from utils import (
+    BASE_CURRENCY,
+    CURRENCY_SYMBOLS,
+    convert_price,
+    format_prices,
+    formatPrice,
+)
 
 logging.basicConfig(level=logging.INFO)
 
+# Page sizes and sort orders of the listing cards
+LISTING_PAGE_SIZES = [10, 20, 50]
+LISTING_SORT_OPTIONS = {
+    "Price (low to high)": ("price", True),
+    "Price (high to low)": ("price", False),
+    "Price per sqm (low to high)": ("price_per_sqm", True),
+    "Floor area (largest first)": ("floor_area", False),
+    "Bedrooms (most first)": ("bedroom", False),
+}
+
+# Distances offered for the nearby sales, None for the same city only
+NEARBY_RADII_KM = [None, 2, 5, 10, 25]
+
+# Builds a marker from a [latitude, longitude, color, tooltip, popup] row
+MARKER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({
+        icon: "location-dot", prefix: "fa", markerColor: row[2]
+    });
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindTooltip(row[3]);
+    marker.bindPopup(row[4]);
+    return marker;
+};
+"""
+
 # Define CSS to style the property container
 st.markdown(
     """
@@ -56,18 +94,19 @@ st.markdown(
 @st.cache_resource
 def load_classes():
     """Instantiate the classes
-    :return: Database and HousePricePredictor class
+    :return: Database, HousePricePredictor and ListingsStore class
     """
-    logging.info("Instantiating Database and HousePricePredictor classes...")
-    model_path = os.path.join(os.path.dirname(__file__), "../models/rf_model.pkl")
-
+    logging.info(
+        "Instantiating Database, HousePricePredictor and ListingsStore classes..."
+    )
     db = Database()
-    model = HousePricePredictor(model_path)
-    return db, model
+    model = HousePricePredictor(ModelRegistry())
+    store = ListingsStore(ListingsSnapshot(db))
+    return db, model, store
 
 
 ##### global variables #####
-db, model = load_classes()
+db, model, store = load_classes()
 
 
 #################################################################
@@ -98,21 +137,71 @@ def get_cities():
 
 
 def get_listings():
-    """Get all propertyu listings from the database in a dataframe with region_name, city_name as index
-    :return: dataframe with region_name, city_name as index
+    """Get all property listings shared by every session, with region_name, city_name as index
+    :return: read-only dataframe with region_name, city_name as index
+    """
+    logging.info("Getting property listings from the shared store...")
+    return store.listings()
+
+
+def get_filtered_listings():
+    """Get the listings of the location of the estimate from the shared store
+    :return: read-only dataframe of the listings in the city, or within the
+        selected distance of it
+    """
+    if st.session_state.listings_filter is None:
+        return get_listings()
+    region, city, radius_km = st.session_state.listings_filter
+    with latency.time("filter"):
+        listings = store.location_listings(region, city)
+
+        # widen to the listings within the selected distance of the city
+        if radius_km and not listings.empty:
+            listings = store.nearby_listings(
+                listings["latitude"].mean(),
+                listings["longitude"].mean(),
+                radius_km=radius_km,
+            )
+    return listings
+
+
+def get_flat_listings():
+    """Get all property listings shared by every session, with region_name, city_name as columns
+    :return: read-only dataframe with region_name, city_name as columns
     """
-    logging.info("Getting property listings from the database...")
-    df = db.get_listings()
+    return store.flat_listings()
+
 
-    # set index to region_name and city_name
-    df.set_index(["region_name", "city_name"], inplace=True)
+def get_stats():
+    """Get the price statistics cube of all property listings
+    :return: StatsCube with statistics per region and per city
+    """
+    return store.stats()
 
-    # add price_per_sqm column
-    df["price_per_sqm"] = df["price"] / df["lot_area"]
 
-    # add price_eur and price_per_sqm_eur column
-    df = add_eur_price(df)
-    return df
+@st.cache_resource
+def get_region_geojson():
+    """Get the simplified region boundaries, parsed once per process
+    :return: GeoJSON FeatureCollection with the region name in properties.name
+    """
+    return load_region_geojson()
+
+
+@st.cache_resource
+def get_image_cache():
+    """Get the cache of the listing thumbnails, shared by every session
+    :return: ImageCache object
+    """
+    return ImageCache()
+
+
+def log_memory_report():
+    """Log the memory used by the shared listings and by this session"""
+    report = store.memory_report([st.session_state])
+    logging.info(
+        f"Listings memory: shared {report['shared_bytes']} bytes, "
+        f"this session {report['per_session_bytes'][0]} bytes"
+    )
 
 
 def initialize():
@@ -127,27 +216,118 @@ def initialize():
             "city_name"
         ].to_list()
 
-    if "listings_df" not in st.session_state:
-        st.session_state.listings_df = get_listings()
-        st.session_state.filtered_listings_df = st.session_state.listings_df
+    if "listings_filter" not in st.session_state:
+        # the listings are read from the shared store on every run, sessions
+        # only keep the location they were filtered by
+        st.session_state.listings_filter = None
+        log_memory_report()
 
     if "currency" not in st.session_state:
         # set the starting currency
-        st.session_state.currency = "PHP"
+        st.session_state.currency = BASE_CURRENCY
 
-        # set the initial columns to read based on the currency
-        st.session_state.price_col = "price"
-        st.session_state.price_sqm = "price_per_sqm"
 
+def price_range_figure(value_col, region, city, title):
+    """Build the horizontal box plot of a price column in a city from the statistics cube
+    :param value_col: Price column
+    :param region: Region name
+    :param city: City name
+    :param title: Title of the figure
+    :return: Plotly figure
+    """
+    with latency.time("charts"):
+        stats = get_stats()
+        city_stats = stats.city_stats(value_col, get_currency())
+        # the city may have no listings left, e.g. after a sync removed them
+        if (region, city) in city_stats.index:
+            city_stats = city_stats.loc[[(region, city)]]
+        else:
+            city_stats = city_stats.iloc[:0]
+        city_stats = city_stats.droplevel("region_name")
+        outliers = stats.city_outliers(value_col, get_currency(), region)
+        outliers = outliers.set_index("city_name")[value_col]
+
+        fig = box_figure(
+            city_stats,
+            outliers.loc[outliers.index == city],
+            orientation="h",
+            color_discrete_sequence=["#FECB52"],
+            title=title,
+            height=300,
+        )
+        if city_stats.empty:
+            fig.add_annotation(
+                text=f"No listings in {city} yet",
+                xref="paper",
+                yref="paper",
+                x=0.5,
+                y=0.5,
+                showarrow=False,
+            )
+        return fig
 
-def get_color(price, estimated_price):
-    """Get the color of the price based on the estimated price"""
-    if price > estimated_price:
-        return "red"
-    elif price < estimated_price:
-        return "green"
-    else:
-        return "blue"
+
+def get_currency():
+    """Get the currency selected in this session
+    :return: currency code
+    """
+    return st.session_state.get("currency", BASE_CURRENCY)
+
+
+def listing_cards_html(df, currency):
+    """Build the HTML of the listing cards in a single pass over the columns
+    :param df: dataframe of the listings to display
+    :param currency: currency code to display the prices in
+    :return: HTML of the listing cards
+    """
+    prices = format_prices(convert_price(df["price"], currency), currency)
+    prices_per_sqm = format_prices(
+        convert_price(df["price_per_sqm"], currency), currency
+    )
+    distances = (
+        "<br><strong>Distance (km):</strong> " + df["distance_km"].round(1).astype(str)
+        if "distance_km" in df.columns
+        else ""
+    )
+    # serve the cached thumbnails instead of hot-linking the listing images
+    images = get_image_cache().image_urls(df["img_link"].astype(str))
+    cards = (
+        '<div class="property-container">'
+        '<div class="property-image">'
+        '<img src="' + images + '" width="100%" loading="lazy">'
+        "</div>"
+        '<div class="property-details">'
+        "<strong>Bedrooms:</strong> "
+        + df["bedroom"].astype(str)
+        + "<br><strong>Floor Area (sqm):</strong> "
+        + df["floor_area"].astype(str)
+        + "<br><strong>Lot Area (sqm):</strong> "
+        + df["lot_area"].astype(str)
+        + "<br><strong>Price:</strong> "
+        + prices
+        + "<br><strong>Price per sqm:</strong> "
+        + prices_per_sqm
+        + distances
+        + '<br><strong><a href="'
+        + df["link"].astype(str)
+        + '">View Listing</a></strong>'
+        "</div>"
+        "</div>"
+    )
+    return '<div class="property-listings">' + "".join(cards) + "</div>"
+
+
+def get_colors(prices, estimated_price):
+    """Get the colors of the prices based on the estimated price
+    :param prices: Series of prices
+    :param estimated_price: estimated price in the same currency
+    :return: array of colors, red if higher, green if lower, blue if equal
+    """
+    return np.select(
+        [prices > estimated_price, prices < estimated_price],
+        ["red", "green"],
+        default="blue",
+    )
 
 
 #################################################################
@@ -157,6 +337,7 @@ def handle_region_change():
     """Enable or disable the city selectbox depending on the region selected.
     Filter the cities based on the selected region.
     """
+    handle_input_change()
     if st.session_state.region != -1:
         # to enable city selectbox
         st.session_state.set_region = True
@@ -178,22 +359,29 @@ def handle_region_change():
         st.session_state.city_df = get_cities()
 
 
+def handle_input_change():
+    """Hide the previous estimate when an input changes"""
+    st.session_state.show_estimate = False
+
+
 def handle_btn_estimate():
     """Handle the estimate button click"""
-    # filter listings based on selected city and region
-    st.session_state.filtered_listings_df = st.session_state.listings_df.loc[
-        (st.session_state.region, st.session_state.city)
-    ].sort_values(by=[st.session_state.price_col])
+    # keep showing the estimate on reruns, e.g. when paging through listings
+    st.session_state.show_estimate = True
+    st.session_state.listing_page = 1
+
+    # keep the location of the estimate, its listings are looked up on each run
+    st.session_state.listings_filter = (
+        st.session_state.region,
+        st.session_state.city,
+        st.session_state.get("nearby_radius"),
+    )
 
 
 def handle_currency_change():
     """Handle the currency change"""
     logging.info("Handling currency change")
-    (
-        st.session_state.currency,
-        st.session_state.price_col,
-        st.session_state.price_sqm,
-    ) = update_currency(st.session_state.sel_currency)
+    st.session_state.currency = st.session_state.sel_currency
 
 
 #################################################################
@@ -207,28 +395,39 @@ def main():
         "Use SPICEstimate to get an instant home-value estimate and see nearby sales."
     )
 
-    bedrooms, floor_area, lot_area, city, region = st.columns(
+    bedrooms, floor_area, lot_area, city, region, nearby = st.columns(
         [
             1,
             1.5,
             1.5,
             2,
             2,
+            1.5,
         ]
     )
     btn_estimate = st.button("Estimate", on_click=handle_btn_estimate)
 
     with bedrooms:
-        selected_bedrooms = st.selectbox("Bedrooms", db.get_bedrooms())
+        selected_bedrooms = st.selectbox(
+            "Bedrooms", db.get_bedrooms(), on_change=handle_input_change
+        )
 
     with floor_area:
         floor_area_value = st.number_input(
-            "Floor Area (sqm)", value=0, format="%d", min_value=0
+            "Floor Area (sqm)",
+            value=0,
+            format="%d",
+            min_value=0,
+            on_change=handle_input_change,
         )
 
     with lot_area:
         lot_area_value = st.number_input(
-            "Lot Area (sqm)", value=0, format="%d", min_value=0
+            "Lot Area (sqm)",
+            value=0,
+            format="%d",
+            min_value=0,
+            on_change=handle_input_change,
         )
 
     with region:
@@ -251,116 +450,137 @@ def main():
             index=0,
             format_func=lambda x: city_placeholder if x == "-1" else x,
             disabled=not st.session_state.set_region,
+            on_change=handle_input_change,
             key="city",
         )
+    with nearby:
+        st.selectbox(
+            "Nearby sales",
+            NEARBY_RADII_KM,
+            index=0,
+            format_func=lambda x: "Same city" if x is None else f"Within {x} km",
+            on_change=handle_input_change,
+            key="nearby_radius",
+        )
+
     with st.container():
-        if btn_estimate:
-            with st.spinner("Please wait..."):
-                time.sleep(2)
+        if btn_estimate or st.session_state.get("show_estimate", False):
             #################################################################
             ###                Display estimated price                    ###
             #################################################################
             logging.info("Estimating price")
             # Get the predicted price
-            predicted_price = model.predict_price(
-                selected_bedrooms,
-                floor_area_value,
-                lot_area_value,
-                selected_city_name,
-                selected_region_name,
-            )
-            predicted_price = (
-                convert_to_eur(predicted_price)
-                if st.session_state.currency == "EUR"
-                else predicted_price
-            )
+            with latency.time("inference"):
+                predicted_price_base = model.predict_price(
+                    selected_bedrooms,
+                    floor_area_value,
+                    lot_area_value,
+                    selected_city_name,
+                    selected_region_name,
+                )
+            predicted_price = convert_price(predicted_price_base, get_currency())
             # Display the predicted price
             st.markdown(
-                f"#### Estimated Price: **{formatPrice(predicted_price,st.session_state.currency)}**"
+                f"#### Estimated Price: **{formatPrice(predicted_price, get_currency())}**"
             )
+            filtered_listings = get_filtered_listings()
 
             with st.container():
                 #################################################################
                 ###                Display Map of listings                    ###
                 #################################################################
                 st.markdown("##### Map View of Listings in the area")
-                df_map = st.session_state.filtered_listings_df[
-                    [
-                        "latitude",
-                        "longitude",
-                        st.session_state.price_col,
-                        st.session_state.price_sqm,
-                        "link",
-                        "title",
-                        "img_link",
+                with latency.time("map"):
+                    df_map = filtered_listings[
+                        [
+                            "latitude",
+                            "longitude",
+                            "price",
+                            "link",
+                            "title",
+                        ]
                     ]
-                ]
-                # Create a folium map
-                m = folium.Map(
-                    location=[df_map["latitude"].mean(), df_map["longitude"].mean()],
-                    zoom_start=12,
-                    width=1000,
-                )
-
-                # Create a marker cluster group
-                marker_cluster = MarkerCluster().add_to(m)
+                    # Create a folium map
+                    m = folium.Map(
+                        location=[
+                            df_map["latitude"].mean(),
+                            df_map["longitude"].mean(),
+                        ],
+                        zoom_start=12,
+                        width=1000,
+                    )
 
-                # Add markers to the marker cluster
-                for index, row in df_map.iterrows():
-                    color = get_color(row[st.session_state.price_col], predicted_price)
-                    folium.Marker(
-                        location=[row["latitude"], row["longitude"]],
-                        popup=f"<a href='{row['link']}' target='_blank'>{row['title']}</a>",
-                        tooltip=formatPrice(
-                            row[st.session_state.price_col], st.session_state.currency
-                        ),
-                        icon=folium.Icon(color=color, icon="location-dot", prefix="fa"),
-                    ).add_to(marker_cluster)
+                    # Add all markers as a single clustered layer rendered client-side
+                    marker_data = pd.DataFrame(
+                        {
+                            "latitude": df_map["latitude"],
+                            "longitude": df_map["longitude"],
+                            "color": get_colors(df_map["price"], predicted_price_base),
+                            "tooltip": format_prices(
+                                convert_price(df_map["price"], get_currency()),
+                                get_currency(),
+                            ),
+                            "popup": "<a href='"
+                            + df_map["link"]
+                            + "' target='_blank'>"
+                            + df_map["title"]
+                            + "</a>",
+                        }
+                    )
+                    FastMarkerCluster(
+                        marker_data.values.tolist(), callback=MARKER_CALLBACK
+                    ).add_to(m)
 
-                # Display the folium map using folium_static
-                folium_static(m, width=2000, height=600)
+                    # Display the folium map using folium_static
+                    folium_static(m, width=2000, height=600)
 
             #################################################################
             ###                Display other listings                     ###
             #################################################################
             with st.expander("Listings in the area"):
-                st.markdown('<div class="property-listings">', unsafe_allow_html=True)
-                # Display each property listing
-                for index, row in st.session_state.filtered_listings_df.iterrows():
-                    # img_bytes = BytesIO(row["img_bytes"])
+                sort_col, page_size_col, page_col = st.columns([2, 1, 1])
+                with sort_col:
+                    sort_by = st.selectbox(
+                        "Sort by", list(LISTING_SORT_OPTIONS), key="listing_sort"
+                    )
+                with page_size_col:
+                    page_size = st.selectbox(
+                        "Listings per page", LISTING_PAGE_SIZES, key="listing_page_size"
+                    )
+
+                listings = filtered_listings
+                n_pages = max(1, -(-len(listings) // page_size))
+                with page_col:
+                    page = st.number_input(
+                        "Page",
+                        min_value=1,
+                        max_value=n_pages,
+                        key="listing_page",
+                        help=f"{len(listings)} listings in {n_pages} pages",
+                    )
+
+                # Only the listings of the current page are rendered
+                sort_column, ascending = LISTING_SORT_OPTIONS[sort_by]
+                start = (min(page, n_pages) - 1) * page_size
+                page_listings = listings.sort_values(
+                    by=[sort_column], ascending=ascending
+                ).iloc[start : start + page_size]
+                with latency.time("listings"):
                     st.markdown(
-                        f'<div class="property-container">'
-                        f'<div class="property-image">'
-                        f'<img src="{row["img_link"]}" width="100%">'
-                        f"</div>"
-                        f'<div class="property-details">'
-                        f'<strong>Bedrooms:</strong> {row["bedroom"]}<br>'
-                        f'<strong>Floor Area (sqm):</strong> {row["floor_area"]}<br>'
-                        f'<strong>Lot Area (sqm):</strong> {row["lot_area"]}<br>'
-                        f"<strong>Price:</strong> {formatPrice(row[st.session_state.price_col], st.session_state.currency)}<br>"
-                        f"<strong>Price per sqm:</strong> {formatPrice(row[st.session_state.price_sqm], st.session_state.currency)}<br>"
-                        f'<strong><a href="{row["link"]}">View Listing</a></strong>'
-                        f"</div>"
-                        f"</div>",
+                        listing_cards_html(page_listings, get_currency()),
                         unsafe_allow_html=True,
                     )
-                st.markdown("</div>", unsafe_allow_html=True)
 
             #################################################################
             ###         Display Price Range in the Location               ###
             #################################################################
             with st.expander("Price range"):
-                df_price_range = st.session_state.filtered_listings_df.reset_index()
-
                 ################ Start Plot Price range : Boxplot ################
-                fig_price = px.box(
-                    df_price_range,
-                    x=st.session_state.price_col,
-                    y="city_name",
-                    orientation="h",
-                    title="Price Range in " + st.session_state.currency,
-                    height=300,
-                    color_discrete_sequence=["#FECB52"],
+                fig_price = price_range_figure(
+                    "price",
+                    selected_region_name,
+                    selected_city_name,
+                    "Price Range in " + get_currency(),
                 )
 
                 fig_price.add_scatter(
@@ -379,14 +599,11 @@ def main():
                 ################ End Plot Price range ################
 
                 ################ Start Plot Price in SQM range : Boxplot ################
-                fig_pps = px.box(
-                    df_price_range,
-                    x=st.session_state.price_sqm,
-                    y="city_name",
-                    orientation="h",
-                    title="Price per sqm in " + st.session_state.currency,
-                    height=300,
-                    color_discrete_sequence=["#FECB52"],
+                fig_pps = price_range_figure(
+                    "price_per_sqm",
+                    selected_region_name,
+                    selected_city_name,
+                    "Price per sqm in " + get_currency(),
                 )
                 estimated_price_per_sqm = predicted_price / lot_area_value
 
@@ -407,6 +624,9 @@ def main():
 
                 ################ End Plot Price in SQM range ################
 
+            # Log where the estimate latency goes
+            latency.log_summary()
+
 
 if __name__ == "__main__":
     main()
@@ -415,14 +635,19 @@ if __name__ == "__main__":
         cur_col, _ = st.columns([1, 2])
         # set currency
         with cur_col:
-            if "currency" not in st.session_state:
-                index_currency = 0
-            else:
-                index_currency = 0 if st.session_state.currency == "PHP" else 1
+            currencies = list(CURRENCY_SYMBOLS)
+            index_currency = currencies.index(get_currency())
 
             # select currency
             currency = st.selectbox(
-                "Currency", ["PHP", "EUR"], index=index_currency, key="sel_currency"
+                "Currency", currencies, index=index_currency, key="sel_currency"
             )
-            if currency != st.session_state.currency:
+            if currency != get_currency():
                 handle_currency_change()
+
+        # Show the latency percentiles of each stage when debugging
+        if os.getenv("SPICE_DEBUG"):
+            st.markdown("##### Latency (ms)")
+            st.dataframe(pd.DataFrame(latency.summary()).T.round(1))
+            st.markdown("##### Model")
+            st.json(model.model_info())
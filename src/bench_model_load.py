@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+# Formats compared by the benchmark
+FORMATS = ["pickle", "joblib-mmap", "compiled", "compiled-mmap"]
+
+# Number of fresh processes started per format
+DEFAULT_REPEATS = 3
+
+# Number of single-row predictions timed per format
+DEFAULT_LATENCY_CALLS = 1000
+
+# Row scored after loading, so lazily mapped pages are counted
+SAMPLE_ROW = {
+    "Floor Area": [100],
+    "Lot Area": [200],
+    "Bedrooms": [4],
+    "Town/City": ["Lipa"],
+    "Region": ["Batangas"],
+}
+
+
+def memory_usage():
+    """Get the resident memory of the current process, split into private and
+    file-backed pages (file-backed pages are shared with other processes)
+    :return: Dictionary of resident, private and shared bytes
+    """
+    fields = {}
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "RssAnon", "RssFile"):
+                fields[name] = int(value.split()[0]) * 1024
+    return {
+        "rss": fields.get("VmRSS"),
+        "private": fields.get("RssAnon"),
+        "shared": fields.get("RssFile"),
+    }
+
+
+def load(fmt, path):
+    """Load a model artifact and score one row, in a fresh process
+    :param fmt: One of FORMATS
+    :param path: Path of the artifact
+    :return: Dictionary of timings and memory usage
+    """
+    start = time.perf_counter()
+    import pandas as pd
+
+    if fmt in ("compiled", "compiled-mmap"):
+        from compiled_model import CompiledForest
+    else:
+        import joblib
+    imported = time.perf_counter()
+    before = memory_usage()
+
+    if fmt == "pickle":
+        with open(path, "rb") as f:
+            model = pickle.load(f)
+    elif fmt == "joblib-mmap":
+        model = joblib.load(path, mmap_mode="r")
+    else:
+        model = CompiledForest.load(
+            path, mmap_mode="r" if fmt == "compiled-mmap" else None
+        )
+    loaded = time.perf_counter()
+    model.predict(pd.DataFrame(SAMPLE_ROW))
+    predicted = time.perf_counter()
+
+    after = memory_usage()
+    return {
+        "import_s": imported - start,
+        "load_s": loaded - imported,
+        "first_predict_s": predicted - loaded,
+        "cold_start_s": predicted - start,
+        **{f"{key}_bytes": after[key] - before[key] for key in after},
+    }
+
+
+def scoring_latency(model, input_df, calls=DEFAULT_LATENCY_CALLS):
+    """Time single-row predictions, the way the app scores an estimate
+    :param model: Object with a predict method
+    :param input_df: Input rows, scored one at a time in turn
+    :param calls: Number of predictions timed
+    :return: Dictionary of the p50 and p99 latency in milliseconds
+    """
+    import numpy as np
+
+    rows = [input_df.iloc[[i]] for i in range(len(input_df))]
+    model.predict(rows[0])
+    timings = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter()
+        model.predict(rows[i % len(rows)])
+        timings[i] = time.perf_counter() - start
+    p50, p99 = np.percentile(timings, [50, 99]) * 1000
+    return {"p50_ms": p50, "p99_ms": p99}
+
+
+def compare_latency(model_path, calls=DEFAULT_LATENCY_CALLS):
+    """Compare the scoring latency of the pipeline and of the compiled model
+    :param model_path: Path of the pickled pipeline
+    :param calls: Number of predictions timed per model
+    :return: Dictionary of model name: latency dictionary
+    """
+    from compiled_model import CompiledForest
+
+    with open(model_path, "rb") as f:
+        pipeline = pickle.load(f)
+    compiled = CompiledForest(pipeline)
+    input_df = compiled.sample_inputs()
+    return {
+        "pipeline": scoring_latency(pipeline, input_df, calls),
+        "compiled": scoring_latency(compiled, input_df, calls),
+    }
+
+
+def write_artifacts(model_path, directory):
+    """Write the model in every benchmarked format
+    :param model_path: Path of the pickled pipeline
+    :param directory: Directory the artifacts are written to
+    :return: Dictionary of format: artifact path
+    """
+    import joblib
+    from compiled_model import CompiledForest
+
+    with open(model_path, "rb") as f:
+        model = pickle.load(f)
+    paths = {"pickle": model_path}
+
+    paths["joblib-mmap"] = os.path.join(directory, "model.joblib")
+    joblib.dump(model, paths["joblib-mmap"])
+
+    compiled = CompiledForest(model)
+    if not compiled.check_parity(model, compiled.sample_inputs()):
+        raise ValueError("Compiled model does not match the pipeline")
+    paths["compiled"] = paths["compiled-mmap"] = os.path.join(
+        directory, "model.compiled"
+    )
+    compiled.save(paths["compiled"])
+    return paths
+
+
+def run(fmt, path):
+    """Run the load of a format in a fresh interpreter
+    :param fmt: One of FORMATS
+    :param path: Path of the artifact
+    :return: Dictionary of timings and memory usage
+    """
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", fmt, path],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the cold start time, memory and scoring latency of "
+        "the model formats"
+    )
+    parser.add_argument(
+        "--model",
+        default=os.path.join(os.path.dirname(__file__), "../models/rf_model.pkl"),
+    )
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--calls", type=int, default=DEFAULT_LATENCY_CALLS)
+    parser.add_argument("--child", nargs=2, metavar=("FORMAT", "PATH"))
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(load(*args.child)))
+        return
+
+    import pandas as pd
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_artifacts(args.model, directory)
+        # After the first run the artifact is in the page cache, like on a
+        # host where another worker already loaded the model
+        results = [
+            {"format": fmt, **run(fmt, paths[fmt])}
+            for fmt in FORMATS
+            for _ in range(args.repeats)
+        ]
+
+    df = pd.DataFrame(results).groupby("format", sort=False).median()
+    for col in [col for col in df.columns if col.endswith("_bytes")]:
+        df[col.replace("_bytes", "_mb")] = df.pop(col) / 2**20
+    print(df.round(3).to_string())
+
+    latency = pd.DataFrame(compare_latency(args.model, args.calls)).T
+    print(f"\nSingle-row scoring latency over {args.calls} calls")
+    print(latency.round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
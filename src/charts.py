@@ -0,0 +1,59 @@
+import plotly.express as px
+import plotly.graph_objects as go
+
+
+def box_figure(
+    stats,
+    outliers,
+    orientation="v",
+    color_discrete_sequence=px.colors.qualitative.Prism,
+    **layout,
+):
+    """Build a box plot from precomputed statistics instead of raw values
+    :param stats: DataFrame indexed by group with q1, median, q3,
+        lower_whisker and upper_whisker columns
+    :param outliers: Series of outlier values indexed by group
+    :param orientation: "v" for vertical boxes, "h" for horizontal boxes
+    :param color_discrete_sequence: Colors of the groups
+    :param layout: Layout properties of the figure
+    :return: Plotly figure with one box per group
+    """
+    fig = go.Figure()
+    outliers_per_group = {
+        group: values.tolist() for group, values in outliers.groupby(level=0)
+    }
+    for i, (group, row) in enumerate(stats.iterrows()):
+        color = color_discrete_sequence[i % len(color_discrete_sequence)]
+        position = "x" if orientation == "v" else "y"
+        value = "y" if orientation == "v" else "x"
+
+        fig.add_trace(
+            go.Box(
+                **{position: [group]},
+                q1=[row["q1"]],
+                median=[row["median"]],
+                q3=[row["q3"]],
+                lowerfence=[row["lower_whisker"]],
+                upperfence=[row["upper_whisker"]],
+                name=str(group),
+                orientation=orientation,
+                marker_color=color,
+                boxpoints=False,
+            )
+        )
+
+        # Outliers are drawn as points on top of the box
+        points = outliers_per_group.get(group, [])
+        if points:
+            fig.add_trace(
+                go.Scatter(
+                    **{position: [group] * len(points), value: points},
+                    mode="markers",
+                    marker_color=color,
+                    name=str(group),
+                    showlegend=False,
+                )
+            )
+
+    fig.update_layout(**layout)
+    return fig
@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Leaf marker used by sklearn trees in children_left/children_right
+TREE_LEAF = -1
+
+# Arrays of the compiled model, each stored in its own .npy file
+ARRAY_NAMES = [
+    "mean",
+    "scale",
+    "powers",
+    "feature",
+    "threshold",
+    "left",
+    "right",
+    "value",
+    "roots",
+]
+
+# File of the compiled model holding everything but the arrays
+METADATA_FILENAME = "metadata.json"
+
+# Version of the compiled model layout, bumped when it changes
+FORMAT_VERSION = 1
+
+
+def compiled_path(model_path):
+    """Get the directory of the compiled artifact of a pickled model
+    :param model_path: Path of the pickled pipeline
+    :return: Path of the compiled model directory
+    """
+    return os.path.splitext(model_path)[0] + ".compiled"
+
+
+def source_stamp(model_path):
+    """Identify the version of a model file without reading it
+    :param model_path: Path of the pickled pipeline
+    :return: Dictionary of the file size and modification time
+    """
+    stat = os.stat(model_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class CompiledForest:
+    """Scores the trained pipeline without going through sklearn.
+
+    The StandardScaler/PolynomialFeatures/OneHotEncoder steps are replaced by
+    precomputed arrays and lookup tables, and the trees of the RandomForest are
+    flattened into contiguous node arrays that are traversed for all trees at once.
+    """
+
+    def __init__(self, pipeline):
+        logger.info("Compiling model pipeline")
+        preprocessor = pipeline.named_steps["preprocessor"]
+        forest = pipeline.named_steps["classifier"]
+
+        self._compile_preprocessor(preprocessor)
+        self._compile_forest(forest)
+
+    def save(self, directory, source=None):
+        """Write the compiled model as uncompressed arrays that can be memory-mapped
+        :param directory: Directory of the compiled model
+        :param source: Stamp of the pickled pipeline the model was compiled from
+        """
+        # Write to a temporary directory first so readers never see a partial model
+        tmp_directory = f"{directory}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        for name in ARRAY_NAMES:
+            np.save(
+                os.path.join(tmp_directory, f"{name}.npy"),
+                np.ascontiguousarray(getattr(self, name)),
+            )
+        metadata = {
+            "format_version": FORMAT_VERSION,
+            "source": source,
+            "numerical_features": self.numerical_features,
+            "categorical_features": self.categorical_features,
+            "category_columns": [
+                list(columns.items()) for columns in self.category_columns
+            ],
+            "n_features": self.n_features,
+            "max_depth": self.max_depth,
+        }
+        with open(os.path.join(tmp_directory, METADATA_FILENAME), "w") as f:
+            json.dump(metadata, f)
+
+        old_directory = f"{directory}.old-{os.getpid()}"
+        if os.path.exists(directory):
+            os.replace(directory, old_directory)
+        os.replace(tmp_directory, directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+        logger.info(f"Saved compiled model to {directory}")
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r", source=None):
+        """Load a compiled model, memory-mapping its arrays.
+
+        Mapped arrays live in the page cache, so every process serving the same
+        model shares one copy of them.
+        :param directory: Directory of the compiled model
+        :param mmap_mode: Mode passed to np.load, None to read the arrays into memory
+        :param source: Expected stamp of the pickled pipeline, None to not check it
+        :return: CompiledForest, or None if there is no up to date compiled model
+        """
+        try:
+            with open(os.path.join(directory, METADATA_FILENAME), "r") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if metadata.get("format_version") != FORMAT_VERSION:
+            return None
+        if source is not None and metadata.get("source") != source:
+            logger.info(f"Compiled model {directory} is out of date")
+            return None
+
+        compiled = cls.__new__(cls)
+        compiled.numerical_features = metadata["numerical_features"]
+        compiled.categorical_features = metadata["categorical_features"]
+        compiled.category_columns = [
+            dict(columns) for columns in metadata["category_columns"]
+        ]
+        compiled.n_features = metadata["n_features"]
+        compiled.max_depth = metadata["max_depth"]
+        for name in ARRAY_NAMES:
+            setattr(
+                compiled,
+                name,
+                np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode),
+            )
+        logger.info(f"Loaded compiled model from {directory}")
+        return compiled
+
+    def _compile_preprocessor(self, preprocessor):
+        """Extract the parameters of the numerical and categorical transformers
+        :param preprocessor: Fitted ColumnTransformer of the pipeline
+        """
+        transformers = {
+            name: (transformer, columns)
+            for name, transformer, columns in preprocessor.transformers_
+            if name in ("num", "cat")
+        }
+        num_transformer, self.numerical_features = transformers["num"]
+        cat_transformer, self.categorical_features = transformers["cat"]
+        self.numerical_features = list(self.numerical_features)
+        self.categorical_features = list(self.categorical_features)
+
+        scaler = num_transformer.named_steps["scaler"]
+        self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+        self.scale = np.asarray(scaler.scale_, dtype=np.float64)
+        self.powers = num_transformer.named_steps["polynomial"].powers_
+
+        # Map each category to its column in the encoded output; dropped and
+        # unknown categories have no column and encode to all zeros
+        ohe = cat_transformer.named_steps["ohe"]
+        n_num = self.powers.shape[0]
+        offset = n_num
+        self.category_columns = []
+        for i, categories in enumerate(ohe.categories_):
+            drop_idx = None if ohe.drop_idx_ is None else ohe.drop_idx_[i]
+            columns = {}
+            for j, category in enumerate(categories):
+                if j == drop_idx:
+                    continue
+                columns[category] = offset
+                offset += 1
+            self.category_columns.append(columns)
+        self.n_features = offset
+
+    def _compile_forest(self, forest):
+        """Flatten the trees of the forest into contiguous node arrays
+        :param forest: Fitted RandomForestRegressor of the pipeline
+        """
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == TREE_LEAF
+
+            # Leaves point to themselves so the traversal can run a fixed
+            # number of steps for every tree
+            left.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            right.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            value.append(tree.value[:, 0, 0])
+            roots.append(offset)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.value = np.concatenate(value)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = max_depth
+
+    def transform(self, input_df):
+        """Encode the input features the same way as the pipeline's preprocessor
+        :param input_df: DataFrame with the pipeline's input columns
+        :return: Encoded feature matrix
+        """
+        n_rows = len(input_df)
+        X = np.zeros((n_rows, self.n_features), dtype=np.float64)
+
+        numerical = input_df[self.numerical_features].to_numpy(dtype=np.float64)
+        scaled = (numerical - self.mean) / self.scale
+        X[:, : self.powers.shape[0]] = np.prod(
+            scaled[:, None, :] ** self.powers[None, :, :], axis=2
+        )
+
+        rows = np.arange(n_rows)
+        for feature_name, columns in zip(
+            self.categorical_features, self.category_columns
+        ):
+            index = input_df[feature_name].map(columns)
+            known = index.notna().to_numpy()
+            X[rows[known], index[known].to_numpy(dtype=np.intp)] = 1.0
+
+        # sklearn trees compare float32 inputs against the split thresholds
+        return X.astype(np.float32).astype(np.float64)
+
+    def predict(self, input_df):
+        """Predict the log price for each row
+        :param input_df: DataFrame with the pipeline's input columns
+        :return: Array of predicted log prices
+        """
+        X = self.transform(input_df)
+        rows = np.arange(len(X))[:, None]
+
+        # Walk every tree for every row at the same time
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return self.value[node].mean(axis=1)
+
+    def check_parity(self, pipeline, input_df, rtol=1e-6):
+        """Check that the compiled model gives the same predictions as the pipeline
+        :param pipeline: Original sklearn pipeline
+        :param input_df: Sample of input rows to compare on
+        :param rtol: Relative tolerance of the comparison
+        :return: True if all predictions match
+        """
+        expected = np.asarray(pipeline.predict(input_df), dtype=np.float64)
+        actual = self.predict(input_df)
+        return bool(np.allclose(actual, expected, rtol=rtol))
+
+    def sample_inputs(self, n_rows=200, seed=42):
+        """Build a sample of input rows covering the known categories
+        :param n_rows: Number of rows to generate
+        :param seed: Random seed
+        :return: DataFrame with the pipeline's input columns
+        """
+        rng = np.random.default_rng(seed)
+        data = {}
+        for i, feature_name in enumerate(self.numerical_features):
+            data[feature_name] = np.abs(
+                rng.normal(self.mean[i], self.scale[i], n_rows)
+            ).round()
+        for feature_name, columns in zip(
+            self.categorical_features, self.category_columns
+        ):
+            categories = list(columns) or [""]
+            data[feature_name] = [
+                categories[j % len(categories)] for j in range(n_rows)
+            ]
+        return pd.DataFrame(data)
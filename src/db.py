@@ -1,7 +1,12 @@
 import pandas as pd
 import streamlit as st
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 import os
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import logging
 import requests
@@ -10,21 +15,188 @@ from io import BytesIO
 # Load environment variables
 load_dotenv()
 
+# Number of rows sent per INSERT statement by the bulk ingest
+DEFAULT_BATCH_SIZE = 1000
+
+# Connection pool defaults, overridable with DB_POOL_MIN/DB_POOL_MAX
+DEFAULT_POOL_MIN = 1
+DEFAULT_POOL_MAX = 10
+DEFAULT_POOL_TIMEOUT = 30
+
+# Seconds to wait for a new database connection, overridable with DB_CONNECT_TIMEOUT
+DEFAULT_CONNECT_TIMEOUT = 5
+
+# Seconds of changes read again by each delta sync, longer than any ingest
+# transaction so rows committed after a version check are not missed
+SYNC_OVERLAP = 600
+
+# Change tracking of the listing table, the trigger uses clock_timestamp() so
+# updated_at is the time of the write rather than of the transaction start
+CHANGE_TRACKING_DDL = """
+ALTER TABLE listing
+    ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT clock_timestamp();
+CREATE INDEX IF NOT EXISTS listing_updated_at_idx ON listing (updated_at);
+CREATE OR REPLACE FUNCTION listing_set_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS listing_set_updated_at ON listing;
+CREATE TRIGGER listing_set_updated_at BEFORE UPDATE ON listing
+    FOR EACH ROW EXECUTE FUNCTION listing_set_updated_at();
+"""
+
 logger = logging.getLogger(__name__)
 
 
+def drop_unmapped(df, id_column, name_columns):
+    """Drop the rows whose names did not map back to an id, logging them
+    :param df: DataFrame merged with the returned ids
+    :param id_column: Id column, missing for unmapped rows
+    :param name_columns: Columns identifying the unmapped names in the log
+    :return: DataFrame of the mapped rows with an integer id column
+    """
+    unmapped = df[id_column].isna()
+    if unmapped.any():
+        names = df.loc[unmapped, name_columns].drop_duplicates().values.tolist()
+        logger.warning(
+            f"Skipping {int(unmapped.sum())} rows without a {id_column}, "
+            f"unmapped {name_columns}: {names[:10]}"
+        )
+        df = df[~unmapped]
+    return df.astype({id_column: int})
+
+
+class ConnectionPool:
+    """Thread-safe, bounded pool of database connections"""
+
+    def __init__(
+        self, minconn, maxconn, timeout=DEFAULT_POOL_TIMEOUT, **connect_kwargs
+    ):
+        """
+        :param minconn: Number of connections opened up front
+        :param maxconn: Maximum number of connections
+        :param timeout: Seconds to wait for a free connection, None to wait forever
+        :param connect_kwargs: Arguments passed to psycopg2.connect
+        """
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.reconnects = 0
+        self.total_checkout_time = 0.0
+        self.max_checkout_time = 0.0
+
+    def _is_healthy(self, connection):
+        """Check that a connection is still usable
+        :param connection: Connection object
+        :return: True if the connection answers a trivial query
+        """
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _getconn(self):
+        """Get a healthy connection from the pool, reconnecting if it was dropped
+        :return: Connection object
+        """
+        connection = self._pool.getconn()
+        if not self._is_healthy(connection):
+            logger.warning("Dropped database connection, reconnecting")
+            self._pool.putconn(connection, close=True)
+            connection = self._pool.getconn()
+            with self._lock:
+                self.reconnects += 1
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the block
+        :return: Connection object
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(
+            timeout=-1 if self.timeout is None else self.timeout
+        )
+        with self._lock:
+            self.waiting -= 1
+        if not acquired:
+            raise PoolError("Timed out waiting for a database connection")
+
+        try:
+            connection = self._getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        checkout_time = time.perf_counter() - start
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.total_checkout_time += checkout_time
+            self.max_checkout_time = max(self.max_checkout_time, checkout_time)
+
+        broken = False
+        try:
+            yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._pool.putconn(connection, close=broken or bool(connection.closed))
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        """Get the pool usage statistics
+        :return: Dictionary of pool statistics
+        """
+        with self._lock:
+            return {
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "reconnects": self.reconnects,
+                "avg_checkout_ms": (
+                    1000 * self.total_checkout_time / self.checkouts
+                    if self.checkouts
+                    else 0.0
+                ),
+                "max_checkout_ms": 1000 * self.max_checkout_time,
+            }
+
+    def close(self):
+        """Close all connections of the pool"""
+        self._pool.closeall()
+
+
 class Database:
     def __init__(self):
         logger.info("Initializing database")
-        self.connection = self.get_connection()
-        self.cursor = self.connection.cursor()
+        self.pool = self.get_pool()
 
     @st.cache_resource
-    def get_connection(_self):
-        """Get the database connection
-        :return: Connection object
+    def get_pool(_self):
+        """Get the database connection pool
+        :return: ConnectionPool object
         """
-        logger.info("Getting database connection")
+        logger.info("Creating database connection pool")
         # Get database credentials
         db_host = os.getenv("DB_HOST")
         db_port = os.getenv("DB_PORT")
@@ -32,15 +204,35 @@ class Database:
         db_user = os.getenv("DB_USER")
         db_password = os.getenv("DB_PASSWORD")
 
-        # Create a connection to the database
-        connection = psycopg2.connect(
+        # Create a pool of connections to the database
+        pool = ConnectionPool(
+            int(os.getenv("DB_POOL_MIN", DEFAULT_POOL_MIN)),
+            int(os.getenv("DB_POOL_MAX", DEFAULT_POOL_MAX)),
             host=db_host,
             port=db_port,
             dbname=db_name,
             user=db_user,
             password=db_password,
+            connect_timeout=int(
+                os.getenv("DB_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)
+            ),
         )
-        return connection
+        return pool
+
+    @contextmanager
+    def get_cursor(self):
+        """Get a cursor on a pooled connection for the duration of the block
+        :return: Cursor object
+        """
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                yield cursor
+
+    def pool_stats(self):
+        """Get the connection pool statistics
+        :return: Dictionary of pool statistics
+        """
+        return self.pool.stats()
 
     @st.cache_data
     def get_bedrooms(_self):
@@ -48,8 +240,9 @@ class Database:
         :return: List of bedrooms
         """
         logger.debug("Getting number of bedrooms...")
-        _self.cursor.execute("SELECT DISTINCT bedroom FROM listing ORDER BY bedroom")
-        return [row[0] for row in _self.cursor.fetchall()]
+        with _self.get_cursor() as cursor:
+            cursor.execute("SELECT DISTINCT bedroom FROM listing ORDER BY bedroom")
+            return [row[0] for row in cursor.fetchall()]
 
     @st.cache_data
     def get_cities(
@@ -60,12 +253,13 @@ class Database:
         :return: List of cities
         """
         logger.info("Getting cities...")
-        _self.cursor.execute(
-            "SELECT region_id, city_id, city_name FROM city ORDER BY city_name"
-        )
-        return pd.DataFrame(
-            _self.cursor.fetchall(), columns=["region_id", "city_id", "city_name"]
-        )
+        with _self.get_cursor() as cursor:
+            cursor.execute(
+                "SELECT region_id, city_id, city_name FROM city ORDER BY city_name"
+            )
+            return pd.DataFrame(
+                cursor.fetchall(), columns=["region_id", "city_id", "city_name"]
+            )
 
     @st.cache_data
     def get_regions(_self):
@@ -74,125 +268,323 @@ class Database:
         """
         logger.info("Getting regions...")
 
-        _self.cursor.execute(
-            "SELECT region_id,region_name FROM region ORDER BY region_name"
-        )
-
-        return [(row[0], row[1]) for row in _self.cursor.fetchall()]
+        with _self.get_cursor() as cursor:
+            cursor.execute(
+                "SELECT region_id,region_name FROM region ORDER BY region_name"
+            )
+            return [(row[0], row[1]) for row in cursor.fetchall()]
 
     @st.cache_data
     def get_listings(_self):
         """Get all listings
         :return: List of listings
         """
-        df_listings = pd.read_sql_query(
-            """SELECT 
-                listing_id, 
-                title, 
-                price, 
-                bedroom, 
-                floor_area, 
-                lot_area, 
-                link, 
-                city_name, 
-                region_name, 
-                latitude, 
-                longitude,
-                img_link
-                FROM listing 
-                INNER JOIN city ON listing.city_id = city.city_id 
-                INNER JOIN region ON listing.region_id = region.region_id
-                INNER JOIN geo_point ON listing.geo_point_id = geo_point.geo_point_id""",
-            _self.connection,
-        )
-        return df_listings
+        return _self.query_listings()
 
-    def insert_data(self, df):
-        """Insert data into the database
-        :param df: DataFrame containing the data to be inserted
+    def ensure_change_tracking(self):
+        """Add the updated_at column, its index and its trigger to the listing
+        table if they are missing. Safe to run on every ingest.
         """
-        logging.info("Inserting data into the database")
+        with self.pool.connection() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(CHANGE_TRACKING_DDL)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
 
-        # Loop through DataFrame rows and insert data into tables
-        for index, row in df.iterrows():
-            # Insert region into "regions" table
-            self.cursor.execute(
-                "INSERT INTO region (region_name) VALUES (%s) ON CONFLICT (region_name) DO NOTHING RETURNING region_id",
-                (row["Region"],),
-            )
-            # if cursor.rowcount == 0 then select the region_id
-            if self.cursor.rowcount == 0:
-                self.cursor.execute(
-                    "SELECT region_id FROM region WHERE region_name = %s",
-                    (row["Region"],),
-                )
-            region_id = self.cursor.fetchone()[0]
-
-            # Insert city into "cities" table
-            self.cursor.execute(
-                "INSERT INTO city (region_id,city_name) VALUES (%s,%s) ON CONFLICT (city_name,region_id) DO NOTHING RETURNING city_id",
-                (
-                    region_id,
-                    row["Town/City"],
-                ),
-            )
-            # if cursor.rowcount == 0 then select the city_id
-            if self.cursor.rowcount == 0:
-                self.cursor.execute(
-                    "SELECT city_id FROM city WHERE city_name = %s", (row["Town/City"],)
-                )
-            city_id = self.cursor.fetchone()[0]
-
-            # Insert geo_points to "geo_point" table
-            self.cursor.execute(
-                "INSERT INTO geo_point (latitude, longitude) VALUES (%s, %s) RETURNING geo_point_id",
-                (row["Latitude"], row["Longitude"]),
+    def get_listings_version(self):
+        """Get the version of the listings table
+        :return: Dictionary with the row count, the latest updated_at, the
+            number of rows updated within SYNC_OVERLAP and the time of the check,
+            as epoch seconds
+        """
+        with self.get_cursor() as cursor:
+            # The check time is read first, so it is a safe watermark for the
+            # delta read that follows
+            cursor.execute(
+                """SELECT
+                    EXTRACT(EPOCH FROM checked_at),
+                    (SELECT COUNT(*) FROM listing),
+                    (SELECT EXTRACT(EPOCH FROM MAX(updated_at)) FROM listing),
+                    (SELECT COUNT(*) FROM listing
+                        WHERE updated_at > checked_at - %s * INTERVAL '1 second')
+                FROM (SELECT clock_timestamp() AS checked_at) AS t""",
+                (SYNC_OVERLAP,),
             )
-            geo_point_id = self.cursor.fetchone()[0]
+            checked_at, row_count, max_updated_at, recent_count = cursor.fetchone()
+        return {
+            "row_count": row_count,
+            "max_updated_at": float(max_updated_at or 0),
+            "recent_count": recent_count,
+            "checked_at": float(checked_at),
+        }
 
-            # get image bytes from url
-
-            # Insert property listing into "listings" table with region_id and city_id
-            self.cursor.execute(
-                """INSERT INTO listing (
+    def query_listings(self, where="", params=None):
+        """Query listings from the database, bypassing the cache
+        :param where: Optional WHERE clause to filter the listings
+        :param params: Parameters of the WHERE clause
+        :return: DataFrame of listings
+        """
+        with self.pool.connection() as connection:
+            df_listings = pd.read_sql_query(
+                f"""SELECT 
+                    listing_id, 
                     title, 
                     price, 
                     bedroom, 
                     floor_area, 
                     lot_area, 
                     link, 
-                    region_id, 
-                    city_id, 
-                    geo_point_id,
-                    img_link,
-                    img_bytes
-                    ) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                (
-                    row["Title"],
-                    row["Price"],
-                    row["Bedrooms"],
-                    row["Floor Area"],
-                    row["Lot Area"],
-                    row["URL"],
-                    region_id,
-                    city_id,
-                    geo_point_id,
-                    row["Image Link"],
-                    row["img_bytes"],
-                ),
+                    city_name, 
+                    region_name, 
+                    latitude, 
+                    longitude,
+                    img_link
+                    FROM listing 
+                    INNER JOIN city ON listing.city_id = city.city_id 
+                    INNER JOIN region ON listing.region_id = region.region_id
+                    INNER JOIN geo_point ON listing.geo_point_id = geo_point.geo_point_id
+                    {where}""",
+                connection,
+                params=params,
             )
+        return df_listings
+
+    def query_listings_delta(self, watermark):
+        """Query the listings added or updated since a watermark. Rows updated
+        up to SYNC_OVERLAP seconds before the watermark are read again, to pick
+        up transactions that committed after the watermark was taken.
+        :param watermark: Time of the previous version check, as epoch seconds
+        :return: DataFrame of new and updated listings
+        """
+        logger.info(f"Getting listings updated since {watermark}...")
+        return self.query_listings(
+            "WHERE listing.updated_at > to_timestamp(%s)",
+            (watermark - SYNC_OVERLAP,),
+        )
+
+    def get_listing_ids(self):
+        """Get the ids of all listings
+        :return: List of listing ids
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("SELECT listing_id FROM listing")
+            return [row[0] for row in cursor.fetchall()]
+
+    def insert_data(self, df, bulk=True, batch_size=DEFAULT_BATCH_SIZE):
+        """Insert data into the database
+        :param df: DataFrame containing the data to be inserted
+        :param bulk: Use the bulk ingest, else insert row by row
+        :param batch_size: Number of rows per INSERT statement for the bulk ingest
+        :return: Number of listings inserted by the bulk ingest
+        """
+        if bulk:
+            return self.insert_data_bulk(df, batch_size)
+        return self.insert_data_rows(df)
+
+    def insert_data_bulk(self, df, batch_size=DEFAULT_BATCH_SIZE):
+        """Insert data into the database in a single transaction using batched inserts
+        :param df: DataFrame containing the data to be inserted
+        :param batch_size: Number of rows per INSERT statement
+        :return: Number of listings inserted
+        """
+        logger.info(f"Bulk inserting {len(df)} rows into the database")
+        start = time.perf_counter()
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                # Upsert the distinct regions and map their ids back to the rows
+                regions = df["Region"].drop_duplicates().tolist()
+                region_ids = execute_values(
+                    cursor,
+                    """INSERT INTO region (region_name) VALUES %s
+                    ON CONFLICT (region_name) DO UPDATE SET region_name = EXCLUDED.region_name
+                    RETURNING region_id, region_name""",
+                    [(region,) for region in regions],
+                    page_size=max(len(regions), 1),
+                    fetch=True,
+                )
+                df = df.merge(
+                    pd.DataFrame(region_ids, columns=["region_id", "Region"]),
+                    on="Region",
+                    how="left",
+                )
+                df = drop_unmapped(df, "region_id", ["Region"])
 
-            # Commit the transaction
-            self.connection.commit()
-            logging.info("Data inserted successfully")
+                # Upsert the distinct cities and map their ids back to the rows
+                cities = df[["region_id", "Town/City"]].drop_duplicates()
+                city_ids = execute_values(
+                    cursor,
+                    """INSERT INTO city (region_id, city_name) VALUES %s
+                    ON CONFLICT (city_name, region_id) DO UPDATE SET city_name = EXCLUDED.city_name
+                    RETURNING city_id, region_id, city_name""",
+                    list(
+                        zip(cities["region_id"].tolist(), cities["Town/City"].tolist())
+                    ),
+                    page_size=max(len(cities), 1),
+                    fetch=True,
+                )
+                df = df.merge(
+                    pd.DataFrame(
+                        city_ids, columns=["city_id", "region_id", "Town/City"]
+                    ),
+                    on=["region_id", "Town/City"],
+                    how="left",
+                )
+                df = drop_unmapped(df, "city_id", ["Region", "Town/City"])
+
+                # Reserve the geo_point ids up front so listings can reference them
+                cursor.execute(
+                    """SELECT nextval(pg_get_serial_sequence('geo_point', 'geo_point_id'))
+                    FROM generate_series(1, %s)""",
+                    (len(df),),
+                )
+                df["geo_point_id"] = [row[0] for row in cursor.fetchall()]
+                execute_values(
+                    cursor,
+                    "INSERT INTO geo_point (geo_point_id, latitude, longitude) VALUES %s",
+                    list(
+                        zip(
+                            df["geo_point_id"].tolist(),
+                            df["Latitude"].tolist(),
+                            df["Longitude"].tolist(),
+                        )
+                    ),
+                    page_size=batch_size,
+                )
+
+                columns = [
+                    "Title",
+                    "Price",
+                    "Bedrooms",
+                    "Floor Area",
+                    "Lot Area",
+                    "URL",
+                    "region_id",
+                    "city_id",
+                    "geo_point_id",
+                    "Image Link",
+                    "img_bytes",
+                ]
+                execute_values(
+                    cursor,
+                    """INSERT INTO listing (
+                        title,
+                        price,
+                        bedroom,
+                        floor_area,
+                        lot_area,
+                        link,
+                        region_id,
+                        city_id,
+                        geo_point_id,
+                        img_link,
+                        img_bytes
+                        )
+                        VALUES %s""",
+                    list(zip(*(df[column].tolist() for column in columns))),
+                    page_size=batch_size,
+                )
+
+                # Commit everything in one transaction
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+        elapsed = time.perf_counter() - start
+        rows_per_sec = len(df) / elapsed if elapsed > 0 else float("inf")
+        logger.info(
+            f"Inserted {len(df)} rows in {elapsed:.2f}s ({rows_per_sec:.0f} rows/sec)"
+        )
+        return len(df)
+
+    def insert_data_rows(self, df):
+        """Insert data into the database one row at a time
+        :param df: DataFrame containing the data to be inserted
+        """
+        logging.info("Inserting data into the database")
+
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            # Loop through DataFrame rows and insert data into tables
+            for index, row in df.iterrows():
+                # Insert region into "regions" table
+                cursor.execute(
+                    "INSERT INTO region (region_name) VALUES (%s) ON CONFLICT (region_name) DO NOTHING RETURNING region_id",
+                    (row["Region"],),
+                )
+                # if cursor.rowcount == 0 then select the region_id
+                if cursor.rowcount == 0:
+                    cursor.execute(
+                        "SELECT region_id FROM region WHERE region_name = %s",
+                        (row["Region"],),
+                    )
+                region_id = cursor.fetchone()[0]
+
+                # Insert city into "cities" table
+                cursor.execute(
+                    "INSERT INTO city (region_id,city_name) VALUES (%s,%s) ON CONFLICT (city_name,region_id) DO NOTHING RETURNING city_id",
+                    (
+                        region_id,
+                        row["Town/City"],
+                    ),
+                )
+                # if cursor.rowcount == 0 then select the city_id
+                if cursor.rowcount == 0:
+                    cursor.execute(
+                        "SELECT city_id FROM city WHERE city_name = %s",
+                        (row["Town/City"],),
+                    )
+                city_id = cursor.fetchone()[0]
+
+                # Insert geo_points to "geo_point" table
+                cursor.execute(
+                    "INSERT INTO geo_point (latitude, longitude) VALUES (%s, %s) RETURNING geo_point_id",
+                    (row["Latitude"], row["Longitude"]),
+                )
+                geo_point_id = cursor.fetchone()[0]
+
+                # get image bytes from url
+
+                # Insert property listing into "listings" table with region_id and city_id
+                cursor.execute(
+                    """INSERT INTO listing (
+                        title, 
+                        price, 
+                        bedroom, 
+                        floor_area, 
+                        lot_area, 
+                        link, 
+                        region_id, 
+                        city_id, 
+                        geo_point_id,
+                        img_link,
+                        img_bytes
+                        ) 
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                    (
+                        row["Title"],
+                        row["Price"],
+                        row["Bedrooms"],
+                        row["Floor Area"],
+                        row["Lot Area"],
+                        row["URL"],
+                        region_id,
+                        city_id,
+                        geo_point_id,
+                        row["Image Link"],
+                        row["img_bytes"],
+                    ),
+                )
 
-        def close_connection(self):
-            """Close the database connection"""
-            self.cursor.close()
-            self.connection.close()
+                # Commit the transaction
+                connection.commit()
+                logging.info("Data inserted successfully")
 
-        def __del__(self):
-            """Destructor"""
-            logging.info("Closing database connection")
-            self.close_connection()
+    def close_connection(self):
+        """Close all database connections"""
+        logging.info("Closing database connections")
+        self.pool.close()
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a cached rate is refreshed
+DEFAULT_RATE_TTL = 6 * 3600
+
+# File holding the last rates successfully fetched
+DEFAULT_RATES_PATH = os.path.join(os.path.dirname(__file__), "../data/fx_rates.json")
+
+# Latest rates of the service forex_python reads from
+FOREX_RATES_URL = "https://theratesapi.com/api/latest"
+
+# Seconds before a rate fetch times out
+DEFAULT_FETCH_TIMEOUT = 10
+
+# Approximate rates used when no rate was ever fetched
+FALLBACK_RATES = {
+    ("PHP", "EUR"): 0.016,
+    ("PHP", "USD"): 0.0175,
+    ("PHP", "SGD"): 0.0235,
+    ("PHP", "JPY"): 2.6,
+    ("EUR", "PHP"): 62.5,
+}
+
+
+class ForexRateSource:
+    """Fetches live rates from the rates service used by forex_python"""
+
+    is_remote = True
+
+    def __init__(self, url=FOREX_RATES_URL, timeout=DEFAULT_FETCH_TIMEOUT):
+        """
+        :param url: URL of the latest rates
+        :param timeout: Seconds before a fetch times out
+        """
+        self.url = url
+        self.timeout = timeout
+
+    def get_rate(self, base, target):
+        """Fetch the exchange rate of a currency pair
+        :param base: Currency to convert from
+        :param target: Currency to convert to
+        :return: Exchange rate
+        """
+        import requests
+
+        # forex_python's CurrencyRates makes this request without a timeout,
+        # which could leave a refresh hanging forever
+        response = requests.get(
+            self.url,
+            params={"base": base, "symbols": target, "rtype": "fpy"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        rate = response.json().get("rates", {}).get(target)
+        if not rate:
+            raise ValueError(f"No {base}/{target} rate in the response")
+        return rate
+
+
+class StaticRateSource:
+    """Serves fixed rates, for tests and offline runs"""
+
+    is_remote = False
+
+    def __init__(self, rates=None):
+        """
+        :param rates: Dictionary of (base, target): rate
+        """
+        self.rates = dict(FALLBACK_RATES if rates is None else rates)
+
+    def get_rate(self, base, target):
+        """Get the exchange rate of a currency pair
+        :param base: Currency to convert from
+        :param target: Currency to convert to
+        :return: Exchange rate
+        """
+        if base == target:
+            return 1.0
+        return self.rates[(base, target)]
+
+
+class RateProvider:
+    """Cached exchange rates with background refresh and a persisted fallback.
+
+    Rates are served from memory; once a rate is older than the TTL it keeps
+    being served while a background thread fetches a new one. Fetched rates are
+    written to a file and used when the source cannot be reached. A pair that
+    was never fetched is served from FALLBACK_RATES until its first fetch
+    completes, so lookups never wait on a remote source.
+    """
+
+    def __init__(self, source, ttl=DEFAULT_RATE_TTL, path=DEFAULT_RATES_PATH):
+        """
+        :param source: Object with a get_rate(base, target) method
+        :param ttl: Seconds before a cached rate is refreshed
+        :param path: File of last known good rates, None to not persist rates
+        """
+        self.source = source
+        self.ttl = ttl
+        self.path = path
+        self._rates = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """Load the last known good rates, marked as expired so they get refreshed"""
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read saved rates: {e}")
+            return
+        for pair, rate in saved.items():
+            base, target = pair.split("/")
+            self._rates[(base, target)] = (rate, None)
+
+    def _save(self):
+        """Persist the cached rates as the last known good rates"""
+        if self.path is None:
+            return
+        with self._lock:
+            saved = {
+                f"{base}/{target}": rate
+                for (base, target), (rate, _) in self._rates.items()
+            }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp-{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump(saved, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save rates: {e}")
+
+    def refresh(self, base, target):
+        """Fetch a rate from the source and cache it
+        :param base: Currency to convert from
+        :param target: Currency to convert to
+        :return: Fetched rate, or None if the source failed
+        """
+        try:
+            try:
+                rate = float(self.source.get_rate(base, target))
+            except Exception as e:
+                logger.warning(f"Could not fetch {base}/{target} rate: {e}")
+                return None
+
+            logger.info(f"Fetched {base}/{target} rate: {rate}")
+            with self._lock:
+                self._rates[(base, target)] = (rate, time.monotonic())
+            self._save()
+            return rate
+        finally:
+            # Always allow the next refresh, whatever happened to this one
+            with self._lock:
+                self._refreshing.discard((base, target))
+
+    def _refresh_in_background(self, base, target):
+        """Start a refresh of a rate unless one is already running"""
+        with self._lock:
+            if (base, target) in self._refreshing:
+                return
+            self._refreshing.add((base, target))
+        threading.Thread(target=self.refresh, args=(base, target), daemon=True).start()
+
+    def get_rate(self, base, target):
+        """Get the exchange rate of a currency pair
+        :param base: Currency to convert from
+        :param target: Currency to convert to
+        :return: Exchange rate
+        """
+        if base == target:
+            return 1.0
+
+        with self._lock:
+            cached = self._rates.get((base, target))
+        if cached is not None:
+            rate, fetched_at = cached
+            if fetched_at is None or time.monotonic() - fetched_at > self.ttl:
+                self._refresh_in_background(base, target)
+            return rate
+
+        # Nothing cached yet. Remote sources are never waited on while a page
+        # renders: serve the approximate rate and fetch the real one meanwhile
+        if not getattr(self.source, "is_remote", True):
+            with self._lock:
+                self._refreshing.add((base, target))
+            rate = self.refresh(base, target)
+            if rate is not None:
+                return rate
+        else:
+            self._refresh_in_background(base, target)
+        rate = FALLBACK_RATES[(base, target)]
+        logger.warning(f"Using fallback {base}/{target} rate: {rate}")
+        return rate
+
+    def convert(self, base, target, amount):
+        """Convert an amount between currencies
+        :param base: Currency to convert from
+        :param target: Currency to convert to
+        :param amount: Amount in the base currency
+        :return: Amount in the target currency
+        """
+        return amount * self.get_rate(base, target)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_rate_provider():
+    """Get the process-wide rate provider.
+
+    Set FX_RATE_SOURCE=static to use the fixed fallback rates instead of
+    fetching live rates.
+    :return: RateProvider object
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if os.getenv("FX_RATE_SOURCE") == "static":
+                _provider = RateProvider(StaticRateSource(), path=None)
+            else:
+                _provider = RateProvider(ForexRateSource())
+        return _provider
+
+
+def set_rate_provider(provider):
+    """Replace the process-wide rate provider, e.g. with a StaticRateSource in tests
+    :param provider: RateProvider object
+    """
+    global _provider
+    with _provider_lock:
+        _provider = provider
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+
+from shapely.geometry import mapping, shape
+
+logger = logging.getLogger(__name__)
+
+# Province boundaries of the Philippines bundled with the repo
+REGION_GEOJSON_PATH = os.path.join(
+    os.path.dirname(__file__), "../data/json/philippines-with-regions_.geojson"
+)
+
+# Simplification tolerance and number of decimals kept, in degrees
+DEFAULT_TOLERANCE = 0.01
+DEFAULT_PRECISION = 3
+
+# Region names of the listings that are named differently in the GeoJSON
+REGION_NAME_ALIASES = {"Metro Manila": "Metropolitan Manila"}
+
+
+def _round_coordinates(coordinates, precision):
+    """Round nested coordinate lists
+    :param coordinates: Coordinates of a GeoJSON geometry
+    :param precision: Number of decimals kept
+    :return: Rounded coordinates
+    """
+    if isinstance(coordinates[0], (int, float)):
+        return [round(value, precision) for value in coordinates]
+    return [_round_coordinates(part, precision) for part in coordinates]
+
+
+def load_region_geojson(
+    path=REGION_GEOJSON_PATH,
+    tolerance=DEFAULT_TOLERANCE,
+    precision=DEFAULT_PRECISION,
+):
+    """Load the region boundaries with simplified, reduced-precision polygons
+    :param path: Path of the GeoJSON file
+    :param tolerance: Simplification tolerance in degrees
+    :param precision: Number of decimals kept in the coordinates
+    :return: GeoJSON FeatureCollection with the region name in properties.name
+    """
+    logger.info(f"Loading region boundaries from {path}")
+    with open(path, "r") as f:
+        geojson = json.load(f)
+
+    features = []
+    for feature in geojson["features"]:
+        geometry = shape(feature["geometry"]).simplify(
+            tolerance, preserve_topology=True
+        )
+        geometry = mapping(geometry)
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {"name": feature["properties"]["name"]},
+                "geometry": {
+                    "type": geometry["type"],
+                    "coordinates": _round_coordinates(
+                        geometry["coordinates"], precision
+                    ),
+                },
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+def region_geo_name(region):
+    """Get the name of a region in the GeoJSON
+    :param region: Region name of the listings
+    :return: Name of the region's feature
+    """
+    return REGION_NAME_ALIASES.get(region, region)
+
+
+def select_features(geojson, names):
+    """Keep only the features of the given regions
+    :param geojson: GeoJSON FeatureCollection
+    :param names: Names of the features to keep
+    :return: GeoJSON FeatureCollection
+    """
+    names = set(names)
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            feature
+            for feature in geojson["features"]
+            if feature["properties"]["name"] in names
+        ],
+    }
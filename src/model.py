@@ -1,22 +1,360 @@
 import pickle
-import streamlit as st
 import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
 import pandas as pd
 import numpy as np
+from compiled_model import CompiledForest, compiled_path, source_stamp
+from timing import latency
+
+# Column order expected by the trained pipeline
+FEATURE_COLUMNS = ["Floor Area", "Lot Area", "Bedrooms", "Town/City", "Region"]
+
+# Number of rows scored per call to the pipeline
+DEFAULT_CHUNK_SIZE = 10000
+
+# Bounds of the prediction cache
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 3600
+
+# Seconds between two checks of the registry manifest
+DEFAULT_CHECK_INTERVAL = 30
+
+# Row scored by a newly loaded model before it serves predictions
+WARMUP_FEATURES = [[100, 200, 4, "Lipa", "Batangas"]]
+
+# Model serving predictions, replaced as a whole when a new version is swapped in
+LoadedModel = namedtuple("LoadedModel", ["version", "path", "model", "compiled"])
+
+
+class PredictionCache:
+    """Bounded LRU cache of predictions with an optional time-to-live"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        """
+        :param maxsize: Maximum number of cached predictions
+        :param ttl: Seconds before a cached prediction expires, None to never expire
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Get a cached prediction
+        :param key: Model version and normalized feature tuple
+        :return: Cached prediction, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Cache a prediction, evicting the least recently used one if full
+        :param key: Model version and normalized feature tuple
+        :param value: Prediction
+        """
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all cached predictions"""
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """Get the cache counters
+        :return: Dictionary of hits, misses, evictions and current size
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
 
 
 class HousePricePredictor:
-    def __init__(self, model_path):
+    """Predicts house prices with the active version of the model registry.
+
+    The active version is loaded on the first prediction. Afterwards the
+    manifest is checked at most every check_interval seconds; a new active
+    version is loaded and warmed up in a background thread, then swapped in
+    with a single assignment so predictions never wait for a load.
+    """
+
+    def __init__(
+        self,
+        registry,
+        use_compiled=True,
+        cache_size=DEFAULT_CACHE_SIZE,
+        cache_ttl=DEFAULT_CACHE_TTL,
+        check_interval=DEFAULT_CHECK_INTERVAL,
+    ):
+        """
+        :param registry: ModelRegistry object
+        :param use_compiled: Score with the compiled forest when possible
+        :param cache_size: Maximum number of cached predictions
+        :param cache_ttl: Seconds before a cached prediction expires
+        :param check_interval: Seconds between two checks of the manifest
+        """
         logging.info("Initializing model")
-        self.model = self.get_model(model_path)
+        self.registry = registry
+        self.use_compiled = use_compiled
+        self.cache = PredictionCache(cache_size, cache_ttl)
+        self.check_interval = check_interval
+        self.active = None
+        self.swaps = 0
+        self.last_load_seconds = None
+        self._loading = None
+        self._failed_version = None
+        self._last_check = None
+        self._lock = threading.Lock()
+        self._first_load_lock = threading.Lock()
 
-    @st.cache_resource
-    def get_model(_self, model_path):
+    def get_model(self, model_path):
+        # Not cached with st.cache_resource: that would pin every version ever
+        # served, and versions are loaded outside of a script run
         logging.info("Getting model")
         with open(model_path, "rb") as model_path:
             model = pickle.load(model_path)
         return model
 
+    def load_compiled(self, model_path):
+        """Memory-map the compiled artifact of a model if it is up to date
+        :param model_path: Path to the pickled model
+        :return: CompiledForest, or None if there is no up to date artifact
+        """
+        try:
+            return CompiledForest.load(
+                compiled_path(model_path), source=source_stamp(model_path)
+            )
+        except (OSError, KeyError, ValueError) as e:
+            logging.warning(f"Could not load compiled model: {e}")
+            return None
+
+    def save_compiled(self, compiled, model_path):
+        """Write the compiled artifact next to the model so later starts can map it
+        :param compiled: CompiledForest of the model
+        :param model_path: Path to the pickled model
+        """
+        try:
+            compiled.save(compiled_path(model_path), source=source_stamp(model_path))
+        except OSError as e:
+            logging.warning(f"Could not save compiled model: {e}")
+
+    def compile_model(self, model):
+        """Build the compiled scorer for the model and check it against the pipeline
+        :param model: Loaded sklearn pipeline
+        :return: CompiledForest, or None if the model could not be compiled
+        """
+        try:
+            compiled = CompiledForest(model)
+            if not compiled.check_parity(model, compiled.sample_inputs()):
+                logging.warning("Compiled model does not match the pipeline")
+                return None
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Could not compile model: {e}")
+            return None
+        logging.info("Using compiled model for predictions")
+        return compiled
+
+    def load_version(self, version, entry):
+        """Load a version of the registry and check it with a warm-up prediction
+        :param version: Name of the version
+        :param entry: Manifest entry of the version
+        :return: LoadedModel ready to serve predictions
+        """
+        features = (entry.get("features") or {}).get("columns")
+        if features is not None and sorted(features) != sorted(FEATURE_COLUMNS):
+            raise ValueError(f"Model expects features {features}")
+
+        model_path = self.registry.path(entry)
+        model, compiled = None, None
+        if self.use_compiled:
+            compiled = self.load_compiled(model_path)
+        if compiled is None:
+            model = self.get_model(model_path)
+            if self.use_compiled:
+                compiled = self.compile_model(model)
+                if compiled is not None:
+                    self.save_compiled(compiled, model_path)
+        loaded = LoadedModel(version, model_path, model, compiled)
+
+        # Touch the model once so the first real prediction does not pay for
+        # page faults, and a broken model is never swapped in
+        warmup = self._score(loaded, self._to_frame(WARMUP_FEATURES))
+        if not np.all(np.isfinite(warmup)):
+            raise ValueError("Warm-up prediction is not finite")
+        return loaded
+
+    def _swap(self, loaded, seconds):
+        """Make a loaded version the one serving predictions
+        :param loaded: LoadedModel
+        :param seconds: Time taken to load the version
+        """
+        previous = self.active
+        self.active = loaded
+        self.cache.clear()
+        self.last_load_seconds = seconds
+        latency.record("model_load", seconds)
+        if previous is not None:
+            self.swaps += 1
+        logging.info(
+            f"Serving model {loaded.version} (loaded in {seconds:.3f}s), "
+            f"previous version {previous.version if previous else None}"
+        )
+
+    def _load_and_swap(self, version, entry):
+        """Load a version in the background and swap it in once it is ready
+        :param version: Name of the version
+        :param entry: Manifest entry of the version
+        """
+        start = time.perf_counter()
+        try:
+            loaded = self.load_version(version, entry)
+        except Exception as e:
+            # Keep serving the current version; the failed one is only retried
+            # once the manifest points to another version
+            logging.error(
+                f"Could not load model {version}, keeping {self.active.version}: {e}"
+            )
+            self._failed_version = version
+        else:
+            self._swap(loaded, time.perf_counter() - start)
+        finally:
+            with self._lock:
+                self._loading = None
+
+    def _check_registry(self):
+        """Start a background load if the registry's active version changed"""
+        now = time.monotonic()
+        with self._lock:
+            if self._loading is not None or (
+                self._last_check is not None
+                and now - self._last_check < self.check_interval
+            ):
+                return
+            self._last_check = now
+
+        try:
+            version, entry = self.registry.active()
+        except (OSError, KeyError, ValueError) as e:
+            logging.warning(f"Could not read the model registry: {e}")
+            return
+
+        with self._lock:
+            if version in (self.active.version, self._failed_version):
+                return
+            if self._loading is not None:
+                return
+            self._loading = version
+        logging.info(f"Loading model {version} in the background")
+        threading.Thread(
+            target=self._load_and_swap, args=(version, entry), daemon=True
+        ).start()
+
+    def get_active(self):
+        """Get the model serving predictions, loading it on first use
+        :return: LoadedModel
+        """
+        active = self.active
+        if active is not None:
+            self._check_registry()
+            return active
+
+        with self._first_load_lock:
+            if self.active is None:
+                start = time.perf_counter()
+                version, entry = self.registry.active()
+                self._swap(
+                    self.load_version(version, entry), time.perf_counter() - start
+                )
+                self._last_check = time.monotonic()
+            return self.active
+
+    def model_info(self):
+        """Get the state of the served model, for logs and metrics
+        :return: Dictionary of the active version, its path, the version being
+            loaded, the number of swaps and the duration of the last load
+        """
+        active = self.active
+        return {
+            "version": active.version if active else None,
+            "path": active.path if active else None,
+            "compiled": active is not None and active.compiled is not None,
+            "loading": self._loading,
+            "swaps": self.swaps,
+            "last_load_seconds": self.last_load_seconds,
+        }
+
+    def _to_frame(self, features):
+        """Convert the input features into a dataframe with the model's columns
+        :param features: DataFrame, NumPy array or iterable of records
+            (dicts or sequences in FEATURE_COLUMNS order)
+        :return: DataFrame with FEATURE_COLUMNS as columns
+        """
+        if isinstance(features, pd.DataFrame):
+            return features[FEATURE_COLUMNS]
+        if isinstance(features, np.ndarray):
+            return pd.DataFrame(features, columns=FEATURE_COLUMNS)
+
+        records = list(features)
+        if records and isinstance(records[0], dict):
+            return pd.DataFrame.from_records(records, columns=FEATURE_COLUMNS)
+        return pd.DataFrame(records, columns=FEATURE_COLUMNS)
+
+    def _score(self, loaded, input_df, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Predict the prices of the input rows with a loaded version
+        :param loaded: LoadedModel
+        :param input_df: DataFrame with FEATURE_COLUMNS as columns
+        :param chunk_size: Number of rows passed to the model per call
+        :return: Array of predicted prices aligned with the input rows
+        """
+        # Score each chunk with a single call to the model
+        scorer = loaded.compiled if loaded.compiled is not None else loaded.model
+        predicted_price_log = np.concatenate(
+            [
+                scorer.predict(input_df.iloc[start : start + chunk_size])
+                for start in range(0, len(input_df), chunk_size)
+            ]
+        )
+
+        # Undo the log1p transform applied to the target during training
+        return np.expm1(predicted_price_log).astype(int)
+
+    def predict_batch(self, features, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Predict the prices of several houses at once
+        :param features: DataFrame, NumPy array or iterable of records with
+            Floor Area, Lot Area, Bedrooms, Town/City and Region
+        :param chunk_size: Number of rows passed to the model per call
+        :return: Array of predicted prices aligned with the input rows
+        """
+        input_df = self._to_frame(features)
+        logging.info(f"Predicting prices for {len(input_df)} rows")
+        if input_df.empty:
+            return np.empty(0, dtype=int)
+        return self._score(self.get_active(), input_df, chunk_size)
+
     def predict_price(self, bedrooms, floor_area, lot_area, city, region):
         """Predict the price of a house given the input features
         :param bedrooms: Number of bedrooms
@@ -26,19 +364,31 @@ class HousePricePredictor:
         :param region: Region
         :return: Predicted price
         """
+        # Normalize once so the cache key and the scored row always agree
+        bedrooms, floor_area, lot_area = (
+            float(bedrooms),
+            float(floor_area),
+            float(lot_area),
+        )
+
+        # The whole prediction uses one version, even if a swap happens meanwhile
+        active = self.get_active()
+        key = (active.version, bedrooms, floor_area, lot_area, city, region)
+        predicted_price = self.cache.get(key)
+        if predicted_price is not None:
+            logging.info(f"Predicted price (cached): {predicted_price}")
+            return predicted_price
 
-        # Prepare the input features for prediction
         input_features = [[floor_area, lot_area, bedrooms, city, region]]
         logging.info(f"Input features: {input_features}")
-        input_df = pd.DataFrame(
-            input_features,
-            columns=["Floor Area", "Lot Area", "Bedrooms", "Town/City", "Region"],
-        )
-        logging.info(f"Input dataframe: {input_df}")
 
-        # Make the prediction using your model
-        predicted_price_log = self.model.predict(input_df)
+        predicted_price = self._score(active, self._to_frame(input_features))[0]
+        logging.info(f"Predicted price: {predicted_price} (model {active.version})")
+        self.cache.put(key, predicted_price)
+        return predicted_price
 
-        predicted_price = np.exp(predicted_price_log) - 1
-        logging.info(f"Predicted price: {predicted_price[0]}")
-        return predicted_price[0].astype(int)
+    def cache_info(self):
+        """Get the prediction cache counters
+        :return: Dictionary of hits, misses, evictions and current size
+        """
+        return self.cache.info()
@@ -1,18 +1,18 @@
 import streamlit as st
 import plotly.express as px
-from Home import handle_currency_change, initialize
-
-
-@st.cache_data
-def session_state_listings():
-    df = st.session_state.listings_df.copy()
-    df.reset_index(inplace=True)
-    df["price_per_sqm"] = df["price"] / df["lot_area"]
-    return df
+from geo import region_geo_name, select_features
+from Home import (
+    get_currency,
+    get_region_geojson,
+    get_stats,
+    handle_currency_change,
+    initialize,
+)
+from utils import CURRENCY_SYMBOLS
 
 
 def main():
-    df = session_state_listings()
+    stats = get_stats()
     st.title("Property Prices in the Philippines Overview")
 
     with st.container():
@@ -21,8 +21,8 @@ def main():
         with col_price_avg:
             # average price per region
             median_price_per_region = (
-                df.groupby("region_name")[st.session_state.price_col]
-                .median()
+                stats.region_stats("price", get_currency())["median"]
+                .rename("price")
                 .reset_index()
             )
 
@@ -30,21 +30,21 @@ def main():
             region_fig = px.bar(
                 median_price_per_region,
                 x="region_name",
-                y=st.session_state.price_col,
+                y="price",
                 title="Median Prices by Region",
                 width=550,
                 color="region_name",
                 color_discrete_sequence=px.colors.qualitative.Prism,
             )
-            region_fig.update_yaxes(title_text="Price in " + st.session_state.currency)
+            region_fig.update_yaxes(title_text="Price in " + get_currency())
             region_fig.update_xaxes(title_text="Region")
             st.plotly_chart(region_fig)
 
         with col_price_sqm_avg:
             # average price per region
             median_price_per_sqm_region = (
-                df.groupby("region_name")[st.session_state.price_sqm]
-                .median()
+                stats.region_stats("price_per_sqm", get_currency())["median"]
+                .rename("price_per_sqm")
                 .reset_index()
             )
 
@@ -52,13 +52,13 @@ def main():
             region_fig2 = px.bar(
                 median_price_per_sqm_region,
                 x="region_name",
-                y=st.session_state.price_sqm,
+                y="price_per_sqm",
                 title="Median Prices per sqm by Region",
                 width=550,
                 color="region_name",
                 color_discrete_sequence=px.colors.qualitative.Prism,
             )
-            region_fig2.update_yaxes(title_text="Price in " + st.session_state.currency)
+            region_fig2.update_yaxes(title_text="Price in " + get_currency())
             region_fig2.update_xaxes(title_text="Region")
             st.plotly_chart(region_fig2)
 
@@ -72,51 +72,83 @@ def main():
         col_city_price_avg, col_city_price_sqm_avg = st.columns(2)
 
         if selectbox_city_avg_price != "Select a Region":
-            city_data = df[df["region_name"] == selectbox_city_avg_price]
             with col_city_price_avg:
                 median_price_per_city = (
-                    city_data.groupby("city_name")[st.session_state.price_col]
-                    .median()
+                    stats.city_stats("price", get_currency(), selectbox_city_avg_price)[
+                        "median"
+                    ]
+                    .rename("price")
                     .reset_index()
                 )
                 # Display the bar chart for average prices per city in the selected region
                 city_fig = px.bar(
                     median_price_per_city,
                     x="city_name",
-                    y=st.session_state.price_col,
+                    y="price",
                     title=f"Median Prices in {selectbox_city_avg_price}",
                     width=550,
                     color="city_name",
                     color_discrete_sequence=px.colors.qualitative.Prism,
                 )
-                city_fig.update_yaxes(
-                    title_text="Price in " + st.session_state.currency
-                )
+                city_fig.update_yaxes(title_text="Price in " + get_currency())
                 city_fig.update_xaxes(title_text="City")
                 st.plotly_chart(city_fig)
 
             with col_city_price_sqm_avg:
                 median_price_sqm_per_city = (
-                    city_data.groupby("city_name")[st.session_state.price_sqm]
-                    .median()
+                    stats.city_stats(
+                        "price_per_sqm", get_currency(), selectbox_city_avg_price
+                    )["median"]
+                    .rename("price_per_sqm")
                     .reset_index()
                 )
                 # Display the bar chart for average prices per sqm per city in the selected region
                 city_fig2 = px.bar(
                     median_price_sqm_per_city,
                     x="city_name",
-                    y=st.session_state.price_sqm,
+                    y="price_per_sqm",
                     title=f"Median Prices per sqm in {selectbox_city_avg_price}",
                     width=550,
                     color="city_name",
                     color_discrete_sequence=px.colors.qualitative.Prism,
                 )
-                city_fig2.update_yaxes(
-                    title_text="Price in " + st.session_state.currency
-                )
+                city_fig2.update_yaxes(title_text="Price in " + get_currency())
                 city_fig2.update_xaxes(title_text="City")
                 st.plotly_chart(city_fig2)
 
+    with st.container():
+        # Median price per sqm by region on the map
+        region_price_sqm = (
+            stats.region_stats("price_per_sqm", get_currency())["median"]
+            .rename("price_per_sqm")
+            .reset_index()
+        )
+        region_price_sqm["geo_name"] = region_price_sqm["region_name"].map(
+            region_geo_name
+        )
+
+        # Only send the boundaries of the regions with listings
+        geojson = select_features(get_region_geojson(), region_price_sqm["geo_name"])
+        choropleth_fig = px.choropleth_mapbox(
+            region_price_sqm,
+            geojson=geojson,
+            locations="geo_name",
+            featureidkey="properties.name",
+            color="price_per_sqm",
+            hover_name="region_name",
+            hover_data={"geo_name": False, "price_per_sqm": ":,.0f"},
+            labels={"price_per_sqm": "Price per sqm in " + get_currency()},
+            title="Median Prices per sqm by Region",
+            color_continuous_scale="Viridis",
+            mapbox_style="carto-positron",
+            zoom=5,
+            center={"lat": 12.5, "lon": 122},
+            opacity=0.7,
+            width=1100,
+            height=700,
+        )
+        st.plotly_chart(choropleth_fig)
+
 
 if __name__ == "__main__":
     initialize()
@@ -126,15 +158,13 @@ if __name__ == "__main__":
         cur_col, _ = st.columns([1, 2])
         # set currency
         with cur_col:
-            if "currency" not in st.session_state:
-                index_currency = 0
-            else:
-                index_currency = 0 if st.session_state.currency == "PHP" else 1
+            currencies = list(CURRENCY_SYMBOLS)
+            index_currency = currencies.index(get_currency())
 
             # select currency
             currency = st.selectbox(
-                "Currency", ["PHP", "EUR"], index=index_currency, key="sel_currency"
+                "Currency", currencies, index=index_currency, key="sel_currency"
             )
-            if currency != st.session_state.currency:
+            if currency != get_currency():
                 handle_currency_change()
                 st.experimental_rerun()
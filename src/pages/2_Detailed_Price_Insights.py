@@ -1,22 +1,96 @@
 import streamlit as st
-import plotly.express as px
-import logging
-from Home import handle_currency_change, initialize
-import pandas as pd
-
-
-@st.cache_data
-def session_state_listings():
-    df = st.session_state.listings_df.copy()
-    df.reset_index(inplace=True)
-    df["price_per_sqm"] = df["price"] / df["lot_area"]
-    return df
+from charts import box_figure
+from Home import get_currency, get_stats, handle_currency_change, initialize
+from utils import CURRENCY_SYMBOLS
+
+
+def location_labels(locations):
+    """Label (region, city) locations, as city names repeat across regions
+    :param locations: Iterable of (region_name, city_name) locations
+    :return: List of "city, region" labels
+    """
+    return [f"{city}, {region}" for region, city in locations]
+
+
+def region_box_figure(stats, value_col, title):
+    """Build the box plot of a price column per region
+    :param stats: StatsCube object
+    :param value_col: Price column
+    :param title: Title of the figure
+    :return: Plotly figure
+    """
+    fig = box_figure(
+        stats.region_stats(value_col, get_currency()),
+        stats.region_outliers(value_col, get_currency()).set_index("region_name")[
+            value_col
+        ],
+        title=title,
+        width=1000,
+        height=600,
+    )
+    fig.update_yaxes(title_text="Price in " + get_currency())
+    fig.update_xaxes(title_text="Region")
+    return fig
+
+
+def city_box_figure(stats, value_col, title):
+    """Build the box plot of a price column per city
+    :param stats: StatsCube object
+    :param value_col: Price column
+    :param title: Title of the figure
+    :return: Plotly figure
+    """
+    # the statistics are shared, label a new frame instead of renaming them
+    city_stats = stats.city_stats(value_col, get_currency())
+    city_stats = city_stats.set_axis(location_labels(city_stats.index))
+
+    outliers = stats.city_outliers(value_col, get_currency())
+    outliers = outliers.set_index(["region_name", "city_name"])[value_col]
+    outliers = outliers.set_axis(location_labels(outliers.index))
+
+    fig = box_figure(
+        city_stats,
+        outliers,
+        title=title,
+        width=1000,
+        height=600,
+    )
+    fig.update_yaxes(title_text="Price in " + get_currency())
+    fig.update_xaxes(title_text="City")
+    return fig
+
+
+def location_box_figure(stats, locations, value_col, title):
+    """Build the box plot of a price column for a few (region, city) locations
+    :param stats: StatsCube object
+    :param locations: Index of (region_name, city_name) locations
+    :param value_col: Price column
+    :param title: Title of the figure
+    :return: Plotly figure
+    """
+    location_stats = stats.city_stats(value_col, get_currency()).loc[locations]
+    location_stats.index = location_labels(locations)
+
+    outliers = stats.city_outliers(value_col, get_currency())
+    outliers = outliers.set_index(["region_name", "city_name"])
+    outliers = outliers[outliers.index.isin(locations)]
+    outliers.index = location_labels(outliers.index)
+
+    fig = box_figure(
+        location_stats,
+        outliers[value_col],
+        title=title,
+        width=800,
+        height=600,
+    )
+    fig.update_layout(
+        xaxis_title="Location", yaxis_title="Price per sqm", xaxis_tickangle=-45
+    )
+    return fig
 
 
 def main():
-    df = session_state_listings()
-    logging.info(df.columns)
-    logging.info(st.session_state.price_sqm)
+    stats = get_stats()
     st.title("Detailed Price Insights")
 
     region_tab, city_tab, summary_tab = st.tabs(
@@ -24,68 +98,26 @@ def main():
     )
 
     with region_tab:
-        region_fig = px.box(
-            df,
-            x="region_name",
-            y=st.session_state.price_col,
-            title="Price Distribution by Region",
-            width=1000,
-            height=600,
-            color="region_name",
-            color_discrete_sequence=px.colors.qualitative.Prism,
-        )
-        region_fig.update_yaxes(title_text="Price in " + st.session_state.currency)
-        region_fig.update_xaxes(title_text="Region")
+        region_fig = region_box_figure(stats, "price", "Price Distribution by Region")
         st.plotly_chart(region_fig)
 
-        region_fig2 = px.box(
-            df,
-            x="region_name",
-            y=st.session_state.price_sqm,
-            title="Price per sqm Distribution by Region",
-            width=1000,
-            height=600,
-            color="region_name",
-            color_discrete_sequence=px.colors.qualitative.Prism,
+        region_fig2 = region_box_figure(
+            stats, "price_per_sqm", "Price per sqm Distribution by Region"
         )
-        region_fig2.update_yaxes(title_text="Price in " + st.session_state.currency)
-        region_fig2.update_xaxes(title_text="Region")
         st.plotly_chart(region_fig2)
 
     with city_tab:
-        city_fig = px.box(
-            df,
-            x="city_name",
-            y=st.session_state.price_col,
-            title="Price Distribution by City",
-            width=1000,
-            height=600,
-            color="city_name",
-            color_discrete_sequence=px.colors.qualitative.Prism,
-        )
-        city_fig.update_yaxes(title_text="Price in " + st.session_state.currency)
-        city_fig.update_xaxes(title_text="City")
+        city_fig = city_box_figure(stats, "price", "Price Distribution by City")
         st.plotly_chart(city_fig)
 
-        city_fig2 = px.box(
-            df,
-            x="city_name",
-            y=st.session_state.price_sqm,
-            title="Price per sqm Distribution by City",
-            width=1000,
-            height=600,
-            color="city_name",
-            color_discrete_sequence=px.colors.qualitative.Prism,
+        city_fig2 = city_box_figure(
+            stats, "price_per_sqm", "Price per sqm Distribution by City"
         )
-        city_fig2.update_yaxes(title_text="Price in " + st.session_state.currency)
-        city_fig2.update_xaxes(title_text="City")
         st.plotly_chart(city_fig2)
 
     with summary_tab:
         # Display top 5 highest priced locations grouped by region and city
-        median_price_per_location = df.groupby(["region_name", "city_name"])[
-            st.session_state.price_sqm
-        ].mean()
+        median_price_per_location = stats.city_stats("price_per_sqm")["mean"]
 
         highest_priced_locations = median_price_per_location.sort_values(
             ascending=False
@@ -95,72 +127,20 @@ def main():
             ascending=True
         ).head(5)
 
-        # Create a DataFrame for the box plot data
-        boxplot_data_highest = []
-        for region, city in highest_priced_locations.index:
-            town_region_data = df[
-                (df["city_name"] == city) & (df["region_name"] == region)
-            ][st.session_state.price_sqm]
-            # town_region_data
-            boxplot_data_highest.append(
-                {
-                    "Location": f"{city}, {region}",
-                    "Price per sqm": town_region_data.values.tolist(),
-                }
-            )
-
-        boxplot_df_highest = pd.DataFrame(boxplot_data_highest).explode("Price per sqm")
-
-        # Create the box plot using Plotly Express
-        highest_priced_fig = px.box(
-            boxplot_df_highest,
-            x="Location",
-            y="Price per sqm",
-            title="Top 5 Locations with Highest Price per sqm",
-            width=800,
-            height=600,
-            color="Location",
-            color_discrete_sequence=px.colors.qualitative.Prism,
-        )
-
-        # Update the layout
-        highest_priced_fig.update_layout(
-            xaxis_title="Location", yaxis_title="Price per sqm", xaxis_tickangle=-45
+        highest_priced_fig = location_box_figure(
+            stats,
+            highest_priced_locations.index,
+            "price_per_sqm",
+            "Top 5 Locations with Highest Price per sqm",
         )
         st.plotly_chart(highest_priced_fig)
 
         ############# lowest priced locations #############
-        # Create a DataFrame for the box plot data
-        boxplot_data_lowest = []
-        for region, city in lowest_priced_locations.index:
-            town_region_data = df[
-                (df["city_name"] == city) & (df["region_name"] == region)
-            ][st.session_state.price_sqm]
-            # town_region_data
-            boxplot_data_lowest.append(
-                {
-                    "Location": f"{city}, {region}",
-                    "Price per sqm": town_region_data.values.tolist(),
-                }
-            )
-
-        boxplot_df_lowest = pd.DataFrame(boxplot_data_lowest).explode("Price per sqm")
-
-        # Create the box plot using Plotly Express
-        lowest_priced_fig = px.box(
-            boxplot_df_lowest,
-            x="Location",
-            y="Price per sqm",
-            title="Top 5 Locations with Lowest Price per sqm",
-            width=800,
-            height=600,
-            color="Location",
-            color_discrete_sequence=px.colors.qualitative.Prism,
-        )
-
-        # Update the layout
-        lowest_priced_fig.update_layout(
-            xaxis_title="Location", yaxis_title="Price per sqm", xaxis_tickangle=-45
+        lowest_priced_fig = location_box_figure(
+            stats,
+            lowest_priced_locations.index,
+            "price_per_sqm",
+            "Top 5 Locations with Lowest Price per sqm",
         )
         st.plotly_chart(lowest_priced_fig)
 
@@ -173,15 +153,13 @@ if __name__ == "__main__":
         cur_col, _ = st.columns([1, 2])
         # set currency
         with cur_col:
-            if "currency" not in st.session_state:
-                index_currency = 0
-            else:
-                index_currency = 0 if st.session_state.currency == "PHP" else 1
+            currencies = list(CURRENCY_SYMBOLS)
+            index_currency = currencies.index(get_currency())
 
             # select currency
             currency = st.selectbox(
-                "Currency", ["PHP", "EUR"], index=index_currency, key="sel_currency"
+                "Currency", currencies, index=index_currency, key="sel_currency"
             )
-            if currency != st.session_state.currency:
+            if currency != get_currency():
                 handle_currency_change()
                 st.experimental_rerun()
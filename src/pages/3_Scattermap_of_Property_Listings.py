@@ -1,34 +1,45 @@
 import streamlit as st
 import plotly.express as px
-from utils import formatPrice
-from Home import handle_currency_change, initialize
+from spatial import grid_aggregate
+from utils import CURRENCY_SYMBOLS, convert_price
+from Home import (
+    get_currency,
+    get_flat_listings,
+    handle_currency_change,
+    initialize,
+)
 
 
-@st.cache_data
-def session_state_listings():
-    df = st.session_state.listings_df.copy()
-    df.reset_index(inplace=True)
-    df["price_per_sqm"] = df["price"] / df["lot_area"]
-    return df
+# Above this many listings in view, listings are aggregated into grid cells
+RAW_POINTS_THRESHOLD = 2000
 
+# Map zoom when showing the whole country and when showing one region
+COUNTRY_ZOOM = 5
+REGION_ZOOM = 8
 
-def main():
-    df = session_state_listings()
-    st.title("Scattermap of Property Listings")
-    st.write(
-        """This page shows the location of the property listings. 
-             The bigger circle markers represent higher price per sqm.
-             Hover over the markers to see the details."""
-    )
-    # # Create scattermap with color-coded markers for each town/city within a region
-    scattermap = px.scatter_mapbox(
+
+def grid_cell_size(zoom):
+    """Get the grid cell size giving roughly 32 pixel cells at a map zoom
+    :param zoom: Map zoom level
+    :return: Cell size in degrees
+    """
+    return 360 / (2**zoom * 8)
+
+
+def raw_scattermap(df, zoom):
+    """Plot every listing, colored by city and sized by price per sqm
+    :param df: DataFrame of listings
+    :param zoom: Map zoom level
+    :return: Plotly figure
+    """
+    return px.scatter_mapbox(
         df,
         lat="latitude",
         lon="longitude",
         color="city_name",
         hover_name="city_name",
-        size=st.session_state.price_sqm,
-        zoom=10,
+        size="price_per_sqm",
+        zoom=zoom,
         center={"lat": df["latitude"].mean(), "lon": df["longitude"].mean()},
         mapbox_style="carto-positron",
         color_discrete_sequence=px.colors.qualitative.Prism,
@@ -36,15 +47,63 @@ def main():
         height=600,
     )
 
-    # Add a heatmap layer based on the price per location
-    # scattermap.add_densitymapbox(
-    #     lat=df["latitude"],
-    #     lon=df["longitude"],
-    #     z=df[st.session_state.price_sqm],
-    #     radius=10,
-    #     colorscale="Viridis",
-    #     showscale=False,
-    # )
+
+def aggregated_scattermap(df, zoom):
+    """Plot grid cells of listings, sized by count and colored by median price per sqm
+    :param df: DataFrame of listings
+    :param zoom: Map zoom level
+    :return: Plotly figure
+    """
+    cells = grid_aggregate(df, grid_cell_size(zoom), "price_per_sqm")
+    cells["median"] = convert_price(cells["median"], get_currency())
+    return px.scatter_mapbox(
+        cells,
+        lat="latitude",
+        lon="longitude",
+        size="count",
+        color="median",
+        hover_data={"count": True, "median": ":,.0f"},
+        labels={
+            "count": "Listings",
+            "median": "Median price per sqm in " + get_currency(),
+        },
+        zoom=zoom,
+        center={"lat": df["latitude"].mean(), "lon": df["longitude"].mean()},
+        mapbox_style="carto-positron",
+        color_continuous_scale="Viridis",
+        width=1000,
+        height=600,
+    )
+
+
+def main():
+    df = get_flat_listings()
+    st.title("Scattermap of Property Listings")
+    st.write(
+        """This page shows the location of the property listings. 
+             The bigger circle markers represent higher price per sqm.
+             Hover over the markers to see the details.
+             When many listings are in view, nearby listings are grouped and
+             the markers show their count and median price per sqm."""
+    )
+
+    # Restrict the view to a region so the map only gets the listings in it
+    region = st.selectbox(
+        "Region",
+        ["All regions"] + sorted(df["region_name"].dropna().unique().tolist()),
+        index=0,
+    )
+    if region != "All regions":
+        df = df[df["region_name"] == region]
+        zoom = REGION_ZOOM
+    else:
+        zoom = COUNTRY_ZOOM
+
+    if len(df) <= RAW_POINTS_THRESHOLD:
+        # # Create scattermap with color-coded markers for each town/city within a region
+        scattermap = raw_scattermap(df, zoom)
+    else:
+        scattermap = aggregated_scattermap(df, zoom)
 
     # Show the plot
     scattermap.update_layout(margin={"r": 0, "t": 40, "l": 0, "b": 0})
@@ -59,15 +118,13 @@ if __name__ == "__main__":
         cur_col, _ = st.columns([1, 2])
         # set currency
         with cur_col:
-            if "currency" not in st.session_state:
-                index_currency = 0
-            else:
-                index_currency = 0 if st.session_state.currency == "PHP" else 1
+            currencies = list(CURRENCY_SYMBOLS)
+            index_currency = currencies.index(get_currency())
 
             # select currency
             currency = st.selectbox(
-                "Currency", ["PHP", "EUR"], index=index_currency, key="sel_currency"
+                "Currency", currencies, index=index_currency, key="sel_currency"
             )
-            if currency != st.session_state.currency:
+            if currency != get_currency():
                 handle_currency_change()
                 st.experimental_rerun()
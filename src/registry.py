@@ -0,0 +1,149 @@
+import argparse
+import copy
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Directory of the model artifacts and of the manifest
+DEFAULT_MODELS_DIR = os.path.join(os.path.dirname(__file__), "../models")
+
+# File listing the registered versions and the active one
+MANIFEST_FILENAME = "manifest.json"
+
+# Model served when no manifest exists yet
+LEGACY_VERSION = "rf_model"
+LEGACY_FILENAME = "rf_model.pkl"
+
+
+class ModelRegistry:
+    """Directory of versioned model artifacts with a manifest.
+
+    The manifest records the path, metrics and feature schema of every
+    registered version, and which version is active. It is replaced
+    atomically, so readers always see either the old or the new manifest.
+    """
+
+    def __init__(self, directory=DEFAULT_MODELS_DIR):
+        """
+        :param directory: Directory of the model artifacts
+        """
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+        self._manifest = None
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+
+    def manifest(self):
+        """Read the manifest, only parsing it again when the file changed
+        :return: Manifest dictionary with versions and active keys
+        """
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._legacy_manifest()
+
+        with self._lock:
+            if mtime == self._manifest_mtime:
+                return self._manifest
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+        with self._lock:
+            self._manifest = manifest
+            self._manifest_mtime = mtime
+        return manifest
+
+    def _legacy_manifest(self):
+        """Describe the unversioned model shipped with the app
+        :return: Manifest dictionary with the legacy model as active version
+        """
+        return {
+            "active": LEGACY_VERSION,
+            "versions": {LEGACY_VERSION: {"path": LEGACY_FILENAME}},
+        }
+
+    def _write(self, manifest):
+        """Atomically replace the manifest
+        :param manifest: Manifest dictionary
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def active(self):
+        """Get the active version
+        :return: Tuple of the version name and its manifest entry
+        """
+        manifest = self.manifest()
+        version = manifest["active"]
+        return version, manifest["versions"][version]
+
+    def path(self, entry):
+        """Get the absolute path of the artifact of a version
+        :param entry: Manifest entry of the version
+        :return: Path of the pickled model
+        """
+        return os.path.join(self.directory, entry["path"])
+
+    def register(self, model_path, report, activate=True):
+        """Add a trained model to the manifest
+        :param model_path: Path of the pickled model, inside the registry directory
+        :param report: Training report with version, metrics and features
+        :param activate: Make the new version the active one
+        :return: Name of the registered version
+        """
+        manifest = copy.deepcopy(self.manifest())
+        version = report["version"]
+        manifest["versions"][version] = {
+            "path": os.path.relpath(model_path, self.directory),
+            "registered_at": datetime.now(timezone.utc).isoformat(),
+            "metrics": report.get("metrics"),
+            "features": report.get("features"),
+        }
+        if activate:
+            manifest["active"] = version
+        self._write(manifest)
+        logger.info(
+            f"Registered model {version}" + (" as active version" if activate else "")
+        )
+        return version
+
+    def activate(self, version):
+        """Make a registered version the active one, e.g. to roll back
+        :param version: Name of the version
+        """
+        manifest = copy.deepcopy(self.manifest())
+        if version not in manifest["versions"]:
+            raise KeyError(f"Model version {version} is not registered")
+        manifest["active"] = version
+        self._write(manifest)
+        logger.info(f"Activated model {version}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the model registry")
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List the registered versions")
+    activate_parser = subparsers.add_parser("activate", help="Activate a version")
+    activate_parser.add_argument("version")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.models_dir)
+    if args.command == "activate":
+        registry.activate(args.version)
+    manifest = registry.manifest()
+    for version, entry in sorted(manifest["versions"].items()):
+        marker = "*" if version == manifest["active"] else " "
+        test_metrics = (entry.get("metrics") or {}).get("test", {})
+        print(f"{marker} {version}  {entry['path']}  {test_metrics}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,38 @@
+import importlib
+
+# Public names and the module defining them. The modules are only imported
+# when a name is first used, so importing the ImageCache in the app does not
+# load httpx, bs4 and lxml.
+_EXPORTS = {
+    "UserAgentPool": "scraper.agents",
+    "get_user_agent_pool": "scraper.agents",
+    "PageCheckpoint": "scraper.checkpoint",
+    "AsyncFetcher": "scraper.fetcher",
+    "FetchError": "scraper.fetcher",
+    "HostRateLimiter": "scraper.fetcher",
+    "run_sync": "scraper.fetcher",
+    "ImageCache": "scraper.images",
+    "cache_images": "scraper.images",
+    "cache_images_async": "scraper.images",
+    "fetch_images": "scraper.images",
+    "make_thumbnail": "scraper.images",
+    "URL_HOUSE": "scraper.lamudi",
+    "get_last_page": "scraper.lamudi",
+    "scrape": "scraper.lamudi",
+    "scrape_async": "scraper.lamudi",
+    "scrape_pages": "scraper.lamudi",
+    "get_listings": "scraper.parse",
+    "iter_listings": "scraper.parse",
+    "pre_process_data": "scraper.parse",
+    "read_listings": "scraper.parse",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
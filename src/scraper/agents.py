@@ -0,0 +1,83 @@
+import logging
+import os
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Directory of the user agent lists, one text file per browser
+USER_AGENTS_DIR = os.path.join(os.path.dirname(__file__), "../../data/user_agents")
+
+# List of browsers (each browser has a text file with UA)
+BROWSERS = [
+    "Firefox",
+    "Internet+Explorer",
+    "Opera",
+    "Safari",
+    "Chrome",
+    "Edge",
+    "Android+Webkit+Browser",
+]
+
+
+class UserAgentPool:
+    """User agents of every browser, read from disk once and kept in memory"""
+
+    def __init__(self, directory=USER_AGENTS_DIR, browsers=BROWSERS):
+        """
+        :param directory: Directory of the user agent text files
+        :param browsers: Names of the browsers, without the .txt extension
+        """
+        self.agents = {}
+        for browser in browsers:
+            agents = self._read(os.path.join(directory, f"{browser}.txt"))
+            if agents:
+                self.agents[browser] = agents
+        if not self.agents:
+            raise ValueError(f"No user agents found in {directory}")
+        self.browsers = list(self.agents)
+        logger.info(
+            f"Loaded {sum(map(len, self.agents.values()))} user agents "
+            f"of {len(self.browsers)} browsers"
+        )
+
+    @staticmethod
+    def _read(file_path):
+        """Read the user agents of a browser, skipping the "More" lines
+        :param file_path: Path of the text file
+        :return: List of user agents
+        """
+        with open(file_path, "r") as file:
+            return [
+                line.strip()
+                for line in file
+                if not line.startswith("More") and line.strip()
+            ]
+
+    def user_agent(self):
+        """Get a random user agent of a randomly selected browser
+        :return: User agent string
+        """
+        browser = random.choice(self.browsers)
+        return random.choice(self.agents[browser])
+
+    def header(self):
+        """Get a random user agent as a header
+        :return: A dictionary containing the header with a User-Agent
+        """
+        return {"User-Agent": self.user_agent()}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_user_agent_pool():
+    """Get the process-wide user agent pool, loading it on first use
+    :return: UserAgentPool object
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = UserAgentPool()
+        return _pool
@@ -0,0 +1,70 @@
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# File name of a saved page
+PAGE_FILENAME = "page_{:05d}.html"
+
+# Pattern matching the file names of saved pages
+PAGE_PATTERN = re.compile(r"page_(\d+)\.html$")
+
+
+class PageCheckpoint:
+    """Directory of scraped pages, one file per page number.
+
+    A page is only written once it was fetched successfully, so an interrupted
+    scrape resumes by fetching the pages that are not saved yet.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: Directory the pages are saved in
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, page):
+        """Get the path of a page
+        :param page: Page number
+        :return: Path of the page file
+        """
+        return os.path.join(self.directory, PAGE_FILENAME.format(page))
+
+    def done(self):
+        """Get the numbers of the pages already saved
+        :return: Set of page numbers
+        """
+        return {
+            int(match.group(1))
+            for match in map(PAGE_PATTERN.match, os.listdir(self.directory))
+            if match
+        }
+
+    def save(self, page, text):
+        """Save a page
+        :param page: Page number
+        :param text: HTML of the page
+        """
+        # Write to a temporary file first so a crash never leaves a partial page
+        path = self.path(page)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def load(self, page):
+        """Read a saved page
+        :param page: Page number
+        :return: HTML of the page
+        """
+        with open(self.path(page), "r") as f:
+            return f.read()
+
+    def pages(self):
+        """Read the saved pages in page order
+        :return: Generator of the HTML of each page
+        """
+        for page in sorted(self.done()):
+            yield self.load(page)
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import httpx
+
+from scraper.agents import get_user_agent_pool
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of requests in flight
+DEFAULT_CONCURRENCY = 8
+
+# Maximum number of requests per second to a single host
+DEFAULT_RATE_LIMIT = 2.0
+
+# Number of retries of a failed request
+DEFAULT_RETRIES = 3
+
+# Seconds waited before the first retry, doubled on every retry
+DEFAULT_BACKOFF = 1.0
+
+# Seconds before a request times out
+DEFAULT_TIMEOUT = 30.0
+
+# Status codes worth retrying, other errors fail straight away
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """Raised when a page could not be fetched after all retries"""
+
+
+class HostRateLimiter:
+    """Spaces out the requests made to each host"""
+
+    def __init__(self, rate_limit=DEFAULT_RATE_LIMIT):
+        """
+        :param rate_limit: Maximum number of requests per second to a host,
+            None for no limit
+        """
+        self.interval = 0.0 if not rate_limit else 1.0 / rate_limit
+        self._next_slot = {}
+
+    async def wait(self, host):
+        """Wait for the next free request slot of a host
+        :param host: Host name
+        """
+        if not self.interval:
+            return
+        # Slots are handed out without awaiting, so no lock is needed
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncFetcher:
+    """Fetches pages concurrently with per-host rate limiting and retries.
+
+    Use as an async context manager so the underlying HTTP client is closed:
+
+        async with AsyncFetcher() as fetcher:
+            html = await fetcher.fetch(url)
+    """
+
+    def __init__(
+        self,
+        concurrency=DEFAULT_CONCURRENCY,
+        rate_limit=DEFAULT_RATE_LIMIT,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        timeout=DEFAULT_TIMEOUT,
+        user_agents=None,
+        client=None,
+    ):
+        """
+        :param concurrency: Maximum number of requests in flight
+        :param rate_limit: Maximum number of requests per second to a host
+        :param retries: Number of retries of a failed request
+        :param backoff: Seconds waited before the first retry
+        :param timeout: Seconds before a request times out
+        :param user_agents: UserAgentPool object, defaults to the shared pool
+        :param client: httpx.AsyncClient to use instead of creating one
+        """
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.user_agents = user_agents or get_user_agent_pool()
+        self.rate_limiter = HostRateLimiter(rate_limit)
+        self.client = client
+        self._owns_client = client is None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._owns_client and self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _retry_delay(self, attempt, response=None):
+        """Get the seconds to wait before retrying a request
+        :param attempt: Number of the failed attempt, starting at 0
+        :param response: Response of the failed attempt, if any
+        :return: Seconds to wait
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return float(retry_after)
+        # Exponential backoff with jitter so retries do not arrive together
+        return self.backoff * 2**attempt * random.uniform(1.0, 1.5)
+
+    async def get(self, url, params=None):
+        """Get a response, retrying on network errors and retryable status codes
+        :param url: URL of the page
+        :param params: Dictionary of query parameters
+        :return: httpx.Response object
+        """
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            response = None
+            async with self._semaphore:
+                await self.rate_limiter.wait(host)
+                try:
+                    response = await self.client.get(
+                        url, params=params, headers=self.user_agents.header()
+                    )
+                except httpx.TransportError as e:
+                    error = e
+                else:
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        response.raise_for_status()
+                        return response
+                    error = f"HTTP {response.status_code}"
+
+            if attempt == self.retries:
+                break
+            delay = self._retry_delay(attempt, response)
+            logger.warning(
+                f"Fetching {url} {params or ''} failed ({error}), "
+                f"retrying in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+
+        raise FetchError(
+            f"Could not fetch {url} {params or ''} after "
+            f"{self.retries + 1} attempts: {error}"
+        )
+
+    async def fetch(self, url, params=None):
+        """Fetch the text of a page
+        :param url: URL of the page
+        :param params: Dictionary of query parameters
+        :return: Text of the page
+        """
+        return (await self.get(url, params=params)).text
+
+    async def fetch_bytes(self, url, params=None):
+        """Fetch the raw content of a URL, e.g. an image
+        :param url: URL of the content
+        :param params: Dictionary of query parameters
+        :return: Bytes of the content
+        """
+        return (await self.get(url, params=params)).content
+
+
+def run_sync(coroutine):
+    """Run a coroutine to completion from synchronous code. Inside a running
+    event loop, e.g. in a Jupyter notebook, it runs on a loop in a separate
+    thread, since asyncio.run cannot be nested.
+    :param coroutine: Coroutine object
+    :return: Result of the coroutine
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# Directory of the thumbnails, served by Streamlit's static file serving
+DEFAULT_IMAGE_DIR = os.path.join(os.path.dirname(__file__), "../static/thumbnails")
+
+# URL the thumbnails directory is served at
+DEFAULT_STATIC_URL = "app/static/thumbnails"
+
+# Width and height of the thumbnails, the size of the listing images
+THUMBNAIL_SIZE = (360, 230)
+
+# JPEG quality of the thumbnails
+THUMBNAIL_QUALITY = 75
+
+# File mapping each image URL to the content hash of its thumbnail
+INDEX_FILENAME = "index.json"
+
+
+def make_thumbnail(content, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """Crop and resize an image to a fixed size compressed JPEG
+    :param content: Bytes of the image
+    :param size: Width and height of the thumbnail
+    :param quality: JPEG quality of the thumbnail
+    :return: Bytes of the thumbnail
+    """
+    # Only the ingest makes thumbnails, the app just serves them
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(content)) as image:
+        thumbnail = ImageOps.fit(image.convert("RGB"), size, Image.LANCZOS)
+    output = BytesIO()
+    thumbnail.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class ImageCache:
+    """Content-addressed on-disk cache of listing image thumbnails.
+
+    Thumbnails are named after the SHA-256 of the original image, so the same
+    image under different URLs is stored once. An index maps each fetched URL
+    to its hash so URLs already in the cache are never fetched again.
+    """
+
+    def __init__(
+        self,
+        directory=DEFAULT_IMAGE_DIR,
+        static_url=DEFAULT_STATIC_URL,
+        size=THUMBNAIL_SIZE,
+        quality=THUMBNAIL_QUALITY,
+    ):
+        """
+        :param directory: Directory of the thumbnails
+        :param static_url: URL the directory is served at
+        :param size: Width and height of the thumbnails
+        :param quality: JPEG quality of the thumbnails
+        """
+        self.directory = directory
+        self.static_url = static_url
+        self.size = size
+        self.quality = quality
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self._index = {}
+        self._index_mtime = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    def refresh(self):
+        """Reload the index if another process updated it"""
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except OSError:
+            return
+        if mtime == self._index_mtime:
+            return
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read image index: {e}")
+            return
+        with self._lock:
+            self._index.update(index)
+            self._index_mtime = mtime
+
+    def save_index(self):
+        """Persist the index of the fetched URLs"""
+        with self._lock:
+            index = dict(self._index)
+        tmp_path = f"{self.index_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = os.path.getmtime(self.index_path)
+
+    def path(self, digest):
+        """Get the path of a thumbnail
+        :param digest: Content hash of the original image
+        :return: Path of the thumbnail file
+        """
+        return os.path.join(self.directory, f"{digest}.jpg")
+
+    def __contains__(self, url):
+        return url in self._index
+
+    def add(self, url, content):
+        """Store the thumbnail of a fetched image
+        :param url: URL of the image
+        :param content: Bytes of the original image
+        :return: Content hash of the image
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            thumbnail = make_thumbnail(content, self.size, self.quality)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(thumbnail)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._index[url] = digest
+        return digest
+
+    def thumbnail(self, url):
+        """Read the thumbnail of an image URL
+        :param url: URL of the image
+        :return: Bytes of the thumbnail, or None if the URL is not cached
+        """
+        digest = self._index.get(url)
+        if digest is None:
+            return None
+        with open(self.path(digest), "rb") as f:
+            return f.read()
+
+    def image_urls(self, urls):
+        """Map image URLs to the URLs of their cached thumbnails
+        :param urls: Series of image URLs
+        :return: Series of thumbnail URLs, the original URL if it is not cached
+        """
+        self.refresh()
+        digests = urls.map(self._index)
+        return (self.static_url + "/" + digests + ".jpg").fillna(urls)
+
+
+async def fetch_images(urls, cache, fetcher):
+    """Fetch the images that are not cached yet and store their thumbnails
+    :param urls: Iterable of image URLs
+    :param cache: ImageCache object
+    :param fetcher: Open AsyncFetcher object
+    :return: List of the URLs that could not be fetched
+    """
+    pending = [url for url in dict.fromkeys(urls) if url and url not in cache]
+    logger.info(f"Fetching {len(pending)} images not in the cache")
+
+    async def fetch_image(url):
+        content = await fetcher.fetch_bytes(url)
+        # Decoding and resizing would block the other downloads
+        await asyncio.to_thread(cache.add, url, content)
+
+    results = await asyncio.gather(
+        *(fetch_image(url) for url in pending), return_exceptions=True
+    )
+    cache.save_index()
+
+    failed = []
+    for url, result in zip(pending, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Could not cache image {url}: {result}")
+            failed.append(url)
+        elif isinstance(result, BaseException):
+            raise result
+    return failed
+
+
+async def cache_images_async(urls, cache, **fetcher_options):
+    """Fetch and cache the thumbnails of image URLs, to be awaited from a
+    running event loop such as a Jupyter notebook
+    :param urls: Iterable of image URLs
+    :param cache: ImageCache object
+    :param fetcher_options: Keyword arguments of AsyncFetcher
+    :return: List of the URLs that could not be fetched
+    """
+    from scraper.fetcher import AsyncFetcher
+
+    async with AsyncFetcher(**fetcher_options) as fetcher:
+        return await fetch_images(urls, cache, fetcher)
+
+
+def cache_images(urls, cache, **fetcher_options):
+    """Fetch and cache the thumbnails of image URLs
+    :param urls: Iterable of image URLs
+    :param cache: ImageCache object
+    :param fetcher_options: Keyword arguments of AsyncFetcher
+    :return: List of the URLs that could not be fetched
+    """
+    from scraper.fetcher import run_sync
+
+    return run_sync(cache_images_async(urls, cache, **fetcher_options))
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from scraper.checkpoint import PageCheckpoint
+from scraper.fetcher import AsyncFetcher, run_sync
+from scraper.parse import DEFAULT_PARSER
+
+logger = logging.getLogger(__name__)
+
+# Search results of the houses for sale
+URL_HOUSE = "https://www.lamudi.com.ph/house/buy/"
+
+
+def get_last_page(html):
+    """Get the last page number from the pagination select element
+    :param html: HTML of a search results page
+    :return: Last page number
+    :rtype: int
+    """
+    # Find the select element to get the number of pages
+    soup = BeautifulSoup(html, DEFAULT_PARSER, parse_only=SoupStrainer("select"))
+    select_element = soup.find("select", class_="js-pagination-dropdown")
+
+    # Extract the value of the data-pagination-end attribute
+    return int(select_element["data-pagination-end"])
+
+
+async def scrape_pages(url, checkpoint, fetcher):
+    """Fetch every page of the search results that is not saved yet
+    :param url: URL of the search results
+    :param checkpoint: PageCheckpoint the pages are saved to
+    :param fetcher: Open AsyncFetcher object
+    :return: Sorted list of the page numbers that could not be fetched
+    """
+    done = checkpoint.done()
+    if 1 in done:
+        first_page = checkpoint.load(1)
+    else:
+        first_page = await fetcher.fetch(url, params={"page": 1})
+        checkpoint.save(1, first_page)
+    last_page = get_last_page(first_page)
+
+    pending = [page for page in range(2, last_page + 1) if page not in done]
+    logger.info(
+        f"Scraping {len(pending)} of {last_page} pages of {url}, "
+        f"{last_page - len(pending)} already saved"
+    )
+
+    async def fetch_page(page):
+        checkpoint.save(page, await fetcher.fetch(url, params={"page": page}))
+
+    results = await asyncio.gather(
+        *(fetch_page(page) for page in pending), return_exceptions=True
+    )
+
+    # Failed pages are left out of the checkpoint and fetched by the next run
+    failed = []
+    for page, result in zip(pending, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Could not scrape page {page}: {result}")
+            failed.append(page)
+        elif isinstance(result, BaseException):
+            raise result
+    return failed
+
+
+async def scrape_async(url, directory, **fetcher_options):
+    """Scrape the pages of the search results into a directory, to be awaited
+    from a running event loop such as a Jupyter notebook
+    :param url: URL of the search results
+    :param directory: Directory the pages are saved in
+    :param fetcher_options: Keyword arguments of AsyncFetcher
+    :return: Sorted list of the page numbers that could not be fetched
+    """
+    async with AsyncFetcher(**fetcher_options) as fetcher:
+        return await scrape_pages(url, PageCheckpoint(directory), fetcher)
+
+
+def scrape(url, directory, **fetcher_options):
+    """Scrape the pages of the search results into a directory
+    :param url: URL of the search results
+    :param directory: Directory the pages are saved in
+    :param fetcher_options: Keyword arguments of AsyncFetcher
+    :return: Sorted list of the page numbers that could not be fetched
+    """
+    return run_sync(scrape_async(url, directory, **fetcher_options))
@@ -0,0 +1,183 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from bs4 import BeautifulSoup, SoupStrainer
+
+logger = logging.getLogger(__name__)
+
+# Parser backend of BeautifulSoup, lxml is several times faster than html.parser
+DEFAULT_PARSER = "lxml"
+
+# Class of the div holding a listing in the search results
+LISTING_CLASS = "row ListingCell-row ListingCell-agent-redesign"
+
+
+def get_span_data(listing, class_name):
+    """Gets the span data from a listing
+    :param listing: a listing from the search results
+    :param class_name: the class name of the span element
+    :return: the span data
+    :rtype: string"""
+    try:
+        return listing.find("span", class_=class_name).next_sibling.strip()
+    except AttributeError:
+        return "0"
+
+
+def get_listings(html, parser=DEFAULT_PARSER):
+    """Get the listings of a search results page
+    :param html: HTML of the page
+    :param parser: Parser backend of BeautifulSoup
+    :return: list of dictionaries, one per listing
+    :rtype: list
+    """
+    # Only build the tree of the listings, the rest of the page is skipped
+    soup = BeautifulSoup(
+        html, parser, parse_only=SoupStrainer("div", class_=LISTING_CLASS)
+    )
+
+    dict_listings = []
+    for listing in soup.find_all("div", class_=LISTING_CLASS):
+        # Extracting the last word in the "alt" attribute
+        img_tag = listing.find("img")
+        region = img_tag["alt"].split(", ")[-1]
+
+        category = listing.find("div", {"data-category": True})["data-category"]
+        data_geo_point = listing.find("div", {"data-geo-point": True})["data-geo-point"]
+
+        title = listing.find("h2", class_="ListingCell-KeyInfo-title").text.strip()
+        address = listing.find(
+            "span", class_="ListingCell-KeyInfo-address-text"
+        ).text.strip()
+        href = listing.find("a", class_="js-listing-link")["href"]
+
+        # Some listings do not have bedrooms, bathrooms, floor area, price and lot area
+        bedrooms = get_span_data(listing, "icon-bedrooms")
+        floor_area = get_span_data(listing, "icon-livingsize")
+        lot_area = get_span_data(listing, "icon-land_size")
+
+        try:
+            img_link = img_tag["data-src"]
+        except KeyError:
+            img_link = img_tag["src"]
+
+        # Some listings do not have price
+        try:
+            price = listing.find("span", class_="PriceSection-FirstPrice").text.strip()
+        except AttributeError:
+            price = "0"
+
+        dict_listings.append(
+            {
+                "Category": category,
+                "Title": title,
+                "Price": price,
+                "Location": address,
+                "Region": region,
+                "Bedrooms": bedrooms,
+                "Floor Area": floor_area,
+                "Lot Area": lot_area,
+                "URL": href,
+                "Geo Point": data_geo_point,
+                "Image Link": img_link,
+            }
+        )
+
+    return dict_listings
+
+
+def parse_page_file(path, parser=DEFAULT_PARSER):
+    """Read and parse a saved page, run in the worker processes
+    :param path: Path of the page file
+    :param parser: Parser backend of BeautifulSoup
+    :return: list of dictionaries, one per listing
+    """
+    with open(path, "r") as f:
+        return get_listings(f.read(), parser)
+
+
+def iter_listings(checkpoint, workers=None, parser=DEFAULT_PARSER):
+    """Parse the saved pages in a process pool and yield their listings in page order.
+
+    Workers are handed page paths rather than page contents, and only a few
+    pages per worker are in flight, so memory does not grow with the crawl.
+    :param checkpoint: PageCheckpoint holding the scraped pages
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :param parser: Parser backend of BeautifulSoup
+    :return: Generator of listing dictionaries
+    """
+    paths = [checkpoint.path(page) for page in sorted(checkpoint.done())]
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Parsing {len(paths)} pages with {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for path in paths:
+            in_flight.append(executor.submit(parse_page_file, path, parser))
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def split_location(location):
+    """
+    Split location into barangay and town/city
+    :param location: Location string
+    :return: Barangay and town/city
+    :rtype: tuple
+    """
+    parts = location.split(", ")
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    elif len(parts) == 1:
+        # If there is no barangay, only return town/city
+        return None, parts[0]
+    else:
+        return None, None
+
+
+def pre_process_data(df_listings):
+    """
+    Pre-process the data
+    :param df_listings: DataFrame of listings
+    :return: Pre-processed DataFrame of listings
+    :rtype: DataFrame
+    """
+
+    def to_int(values, symbol):
+        return values.str.replace(symbol, "").str.replace(",", "").astype(int)
+
+    # Clean and convert price and areas
+    df_listings["Price"] = to_int(df_listings["Price"], "₱")
+    df_listings["Floor Area"] = to_int(df_listings["Floor Area"], "m²")
+    df_listings["Lot Area"] = to_int(df_listings["Lot Area"], "m²")
+
+    # Split location into barangay and town/city
+    df_listings[["Barangay", "Town/City"]] = pd.DataFrame(
+        df_listings["Location"].map(split_location).tolist(),
+        index=df_listings.index,
+    )
+    df_listings.drop(columns=["Location"], inplace=True)
+
+    # Split Geo Point into longitude and latitude
+    geo_points = df_listings["Geo Point"].str.strip("[]").str.split(",", expand=True)
+    df_listings[["Longitude", "Latitude"]] = geo_points
+    df_listings.drop(columns=["Geo Point"], inplace=True)
+
+    return df_listings
+
+
+def read_listings(checkpoint, workers=None, parser=DEFAULT_PARSER):
+    """Parse the saved pages and pre-process the listings
+    :param checkpoint: PageCheckpoint holding the scraped pages
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :param parser: Parser backend of BeautifulSoup
+    :return: Pre-processed DataFrame of listings
+    """
+    return pre_process_data(
+        pd.DataFrame(iter_listings(checkpoint, workers=workers, parser=parser))
+    )
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+logger = logging.getLogger(__name__)
+
+# Default location of the listings snapshot
+DEFAULT_SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(__file__), "../data/snapshot/listings.arrow"
+)
+
+# Minimum number of seconds between two database version checks
+DEFAULT_CHECK_INTERVAL = 60
+
+# Key of the version stamp in the Arrow schema metadata
+VERSION_KEY = b"listings_version"
+
+
+def version_changed(current_version, version):
+    """Compare two version stamps, ignoring the time they were taken at
+    :param current_version: Version dictionary of the snapshot, or None
+    :param version: Version dictionary of the database
+    :return: True if the listings changed
+    """
+    if current_version is None:
+        return True
+    return any(
+        current_version.get(key) != value
+        for key, value in version.items()
+        if key != "checked_at"
+    )
+
+
+class ListingsSnapshot:
+    """Local Arrow snapshot of the joined listings.
+
+    The snapshot is stamped with the database version (row count, latest
+    updated_at and recent changes) and is only refreshed when that version
+    changes. Refreshes fetch only the listings added or updated since the
+    stamped version, and run in a background thread so readers keep getting
+    the current frame meanwhile. The file is stored uncompressed so it can be
+    memory-mapped and shared without copying.
+    """
+
+    def __init__(
+        self, db, path=DEFAULT_SNAPSHOT_PATH, check_interval=DEFAULT_CHECK_INTERVAL
+    ):
+        """
+        :param db: Database object
+        :param path: Path of the snapshot file
+        :param check_interval: Seconds between two database version checks
+        """
+        self.db = db
+        self.path = path
+        self.check_interval = check_interval
+        self.version = None
+        self.df = None
+        self._last_check = None
+        self._checking = False
+        self._lock = threading.Lock()
+        # Serializes the version checks and snapshot writes
+        self._refresh_lock = threading.RLock()
+
+    def read_version(self):
+        """Read the version stamp stored in the snapshot file
+        :return: Version dictionary, or None if there is no snapshot
+        """
+        if not os.path.exists(self.path):
+            return None
+        metadata = pa.ipc.open_file(pa.memory_map(self.path)).schema.metadata or {}
+        if VERSION_KEY not in metadata:
+            return None
+        return json.loads(metadata[VERSION_KEY])
+
+    def write(self, df, version):
+        """Write the listings to the snapshot file with a version stamp
+        :param df: DataFrame of listings
+        :param version: Version dictionary
+        """
+        logger.info(f"Writing listings snapshot {version} to {self.path}")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), VERSION_KEY: json.dumps(version)}
+        )
+
+        # Write to a temporary file first so readers never see a partial
+        # snapshot, named per process as several processes may rebuild at once
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, self.path)
+
+    def read(self):
+        """Memory-map the snapshot file
+        :return: DataFrame of listings
+        """
+        logger.info(f"Reading listings snapshot from {self.path}")
+        table = feather.read_table(self.path, memory_map=True)
+        return table.to_pandas()
+
+    def add_derived_columns(self, df):
+        """Add the columns derived from the queried listings
+        :param df: DataFrame of listings
+        :return: DataFrame with the derived columns
+        """
+        # add price_per_sqm column
+        df["price_per_sqm"] = df["price"] / df["lot_area"]
+        return df
+
+    def rebuild(self, version):
+        """Query the listings from the database and write a new snapshot
+        :param version: Version dictionary of the database
+        """
+        df = self.add_derived_columns(self.db.query_listings())
+        self.write(df, version)
+
+    def sync(self, df, current_version, version):
+        """Apply the listings changed since the current version and write a new
+        snapshot, rebuilding it if the result still disagrees with the database
+        :param df: DataFrame of listings of the current snapshot
+        :param current_version: Version dictionary of the current snapshot
+        :param version: Version dictionary of the database
+        """
+        delta = self.add_derived_columns(
+            self.db.query_listings_delta(current_version["checked_at"])
+        )
+        logger.info(f"Syncing {len(delta)} new or updated listings")
+
+        # Replace updated rows and append new ones
+        df = df[~df["listing_id"].isin(delta["listing_id"])]
+        df = pd.concat([df, delta], ignore_index=True)
+
+        # Only look for deleted listings when the row counts disagree
+        if len(df) != version["row_count"]:
+            df = df[df["listing_id"].isin(self.db.get_listing_ids())]
+            logger.info(f"Removed deleted listings, {len(df)} listings left")
+
+        if len(df) != version["row_count"]:
+            logger.warning(
+                f"Synced {len(df)} listings but the database has "
+                f"{version['row_count']}, rebuilding the snapshot"
+            )
+            self.rebuild(version)
+            return
+        self.write(df, version)
+
+    def check(self):
+        """Check the database version and refresh the snapshot if it changed
+        :return: True if a new snapshot was loaded
+        """
+        with self._refresh_lock:
+            try:
+                db_version = self.db.get_listings_version()
+            except Exception as e:
+                # Keep serving the local snapshot when the database is unreachable
+                if self.df is None and self.read_version() is None:
+                    raise
+                logger.warning(f"Could not check listings version, using snapshot: {e}")
+                return False
+
+            current_version = (
+                self.version if self.df is not None else self.read_version()
+            )
+            if not version_changed(current_version, db_version):
+                return False
+            if current_version is not None and "checked_at" in current_version:
+                df = self.df if self.df is not None else self.read()
+                self.sync(df, current_version, db_version)
+            else:
+                self.rebuild(db_version)
+
+            df, version = self.read(), self.read_version()
+            with self._lock:
+                self.df, self.version = df, version
+            return True
+
+    def _check_in_background(self):
+        """Run a version check in a daemon thread"""
+
+        def run():
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"Could not refresh listings snapshot: {e}")
+            finally:
+                with self._lock:
+                    self._checking = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _load_initial(self):
+        """Load the snapshot file, building it from the database if there is none"""
+        with self._refresh_lock:
+            if self.df is not None:
+                return
+            if self.read_version() is None:
+                self.check()
+                self._last_check = time.monotonic()
+                return
+            df, version = self.read(), self.read_version()
+            with self._lock:
+                self.df, self.version = df, version
+
+    def load(self):
+        """Get the listings of the current snapshot, checking for database
+        changes in a background thread. Only the first load of a process
+        without a snapshot file waits for the database.
+        :return: DataFrame of listings
+        """
+        if self.df is None:
+            self._load_initial()
+
+        with self._lock:
+            now = time.monotonic()
+            due = not self._checking and (
+                self._last_check is None
+                or now - self._last_check >= self.check_interval
+            )
+            if due:
+                self._checking = True
+                self._last_check = now
+            df = self.df
+        if due:
+            self._check_in_background()
+        return df
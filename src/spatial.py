@@ -0,0 +1,85 @@
+import numpy as np
+from sklearn.neighbors import BallTree
+
+# Mean radius of the earth in kilometers
+EARTH_RADIUS_KM = 6371.0088
+
+
+class SpatialIndex:
+    """Haversine BallTree over the coordinates of the listings"""
+
+    def __init__(self, latitudes, longitudes):
+        """
+        :param latitudes: Array of latitudes in degrees
+        :param longitudes: Array of longitudes in degrees
+        """
+        points = np.radians(np.column_stack([latitudes, longitudes]))
+
+        # Listings without coordinates cannot be indexed
+        self.positions = np.flatnonzero(~np.isnan(points).any(axis=1))
+
+        # BallTree cannot be built without points, queries then find nothing
+        self.tree = (
+            BallTree(points[self.positions], metric="haversine")
+            if len(self.positions)
+            else None
+        )
+
+    def _is_empty(self, latitude, longitude):
+        """Check if a query cannot match any listing
+        :param latitude: Latitude of the point in degrees
+        :param longitude: Longitude of the point in degrees
+        :return: True if there is no indexed listing or the point is unknown
+        """
+        return self.tree is None or np.isnan([latitude, longitude]).any()
+
+    def nearest(self, latitude, longitude, k):
+        """Get the k listings nearest to a point
+        :param latitude: Latitude of the point in degrees
+        :param longitude: Longitude of the point in degrees
+        :param k: Number of listings
+        :return: Row positions of the listings and their distances in km, nearest first
+        """
+        k = min(k, len(self.positions))
+        if k == 0 or self._is_empty(latitude, longitude):
+            return np.empty(0, dtype=int), np.empty(0)
+        distances, indices = self.tree.query(np.radians([[latitude, longitude]]), k=k)
+        return self.positions[indices[0]], distances[0] * EARTH_RADIUS_KM
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """Get the listings within a distance of a point
+        :param latitude: Latitude of the point in degrees
+        :param longitude: Longitude of the point in degrees
+        :param radius_km: Radius in km
+        :return: Row positions of the listings and their distances in km, nearest first
+        """
+        if self._is_empty(latitude, longitude):
+            return np.empty(0, dtype=int), np.empty(0)
+        indices, distances = self.tree.query_radius(
+            np.radians([[latitude, longitude]]),
+            r=radius_km / EARTH_RADIUS_KM,
+            return_distance=True,
+            sort_results=True,
+        )
+        return self.positions[indices[0]], distances[0] * EARTH_RADIUS_KM
+
+
+def grid_aggregate(df, cell_deg, value_col):
+    """Bin listings into a square latitude/longitude grid
+    :param df: DataFrame of listings with latitude and longitude columns
+    :param cell_deg: Size of a grid cell in degrees
+    :param value_col: Column summarized by its median in each cell
+    :return: DataFrame with one row per non-empty cell: latitude, longitude
+        (mean position of its listings), count and median of the value column
+    """
+    df = df.dropna(subset=["latitude", "longitude"])
+    cells = df.assign(
+        lat_bin=np.floor(df["latitude"].to_numpy() / cell_deg).astype(np.int64),
+        lon_bin=np.floor(df["longitude"].to_numpy() / cell_deg).astype(np.int64),
+    ).groupby(["lat_bin", "lon_bin"], sort=False)
+    return cells.agg(
+        latitude=("latitude", "mean"),
+        longitude=("longitude", "mean"),
+        count=(value_col, "size"),
+        median=(value_col, "median"),
+    ).reset_index(drop=True)
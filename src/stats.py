@@ -0,0 +1,170 @@
+import logging
+
+import pandas as pd
+
+from utils import BASE_CURRENCY, convert_price
+
+logger = logging.getLogger(__name__)
+
+# Price columns summarized by the cube
+VALUE_COLUMNS = ["price", "price_per_sqm"]
+
+# Statistics computed for every group and price column
+STATS = ["count", "mean", "q1", "median", "q3", "lower_whisker", "upper_whisker"]
+
+# Statistics expressed in the price currency
+PRICE_STATS = ["mean", "q1", "median", "q3", "lower_whisker", "upper_whisker"]
+
+# Maximum number of outliers kept per group
+MAX_OUTLIERS = 50
+
+
+def summarize(df, keys, value_col):
+    """Compute the statistics of a price column for each group
+    :param df: DataFrame of listings
+    :param keys: Columns to group by
+    :param value_col: Price column to summarize
+    :return: DataFrame indexed by the group keys with STATS as columns
+    """
+    grouped = df.groupby(keys)[value_col]
+    stats = pd.DataFrame(
+        {
+            "count": grouped.count(),
+            "mean": grouped.mean(),
+            "q1": grouped.quantile(0.25),
+            "median": grouped.median(),
+            "q3": grouped.quantile(0.75),
+        }
+    )
+
+    # Whiskers are the most extreme values within 1.5 IQR of the quartiles
+    iqr = stats["q3"] - stats["q1"]
+    fences = pd.DataFrame(
+        {"low": stats["q1"] - 1.5 * iqr, "high": stats["q3"] + 1.5 * iqr}
+    )
+    bounds = df[keys].join(fences, on=keys)
+    values = df[value_col]
+    inside = (values >= bounds["low"]) & (values <= bounds["high"])
+    within = df.loc[inside, keys + [value_col]].groupby(keys)[value_col]
+    stats["lower_whisker"] = within.min()
+    stats["upper_whisker"] = within.max()
+    return stats
+
+
+def summarize_outliers(df, keys, value_col, stats, max_outliers=MAX_OUTLIERS):
+    """Get the values outside the whiskers of each group
+    :param df: DataFrame of listings
+    :param keys: Columns to group by
+    :param value_col: Price column
+    :param stats: Statistics of the groups, as returned by summarize
+    :param max_outliers: Maximum number of outliers kept per group, the most
+        extreme ones first
+    :return: DataFrame with the group keys and the price column of the outliers
+    """
+    bounds = df[keys].join(stats[["median", "lower_whisker", "upper_whisker"]], on=keys)
+    values = df[value_col]
+    outside = (values < bounds["lower_whisker"]) | (values > bounds["upper_whisker"])
+
+    outliers = df.loc[outside, keys + [value_col]]
+    distance = (outliers[value_col] - bounds.loc[outside, "median"]).abs()
+    outliers = outliers.loc[distance.sort_values(ascending=False).index]
+    return outliers.groupby(keys).head(max_outliers)
+
+
+def convert_stats(stats, currency):
+    """Convert the price statistics of the groups to another currency
+    :param stats: DataFrame with STATS as columns, in BASE_CURRENCY
+    :param currency: Currency code to convert to
+    :return: DataFrame with the converted statistics
+    """
+    if currency == BASE_CURRENCY:
+        return stats
+    stats = stats.copy()
+    stats[PRICE_STATS] = convert_price(stats[PRICE_STATS], currency)
+    return stats
+
+
+def convert_outliers(outliers, value_col, currency):
+    """Convert the outlier values to another currency
+    :param outliers: DataFrame with the group keys and the price column
+    :param value_col: Price column
+    :param currency: Currency code to convert to
+    :return: DataFrame with the converted price column
+    """
+    if currency == BASE_CURRENCY:
+        return outliers
+    return outliers.assign(**{value_col: convert_price(outliers[value_col], currency)})
+
+
+class StatsCube:
+    """Precomputed price statistics per region and per (region, city).
+
+    Statistics are stored in BASE_CURRENCY and converted when queried, which
+    is exact since every statistic but the count scales with the rate.
+    """
+
+    def __init__(self, df):
+        """
+        :param df: DataFrame of listings with region_name and city_name as columns
+        """
+        logger.info("Building price statistics cube")
+        value_columns = [col for col in VALUE_COLUMNS if col in df.columns]
+        region_keys = ["region_name"]
+        city_keys = ["region_name", "city_name"]
+
+        regions = {col: summarize(df, region_keys, col) for col in value_columns}
+        cities = {col: summarize(df, city_keys, col) for col in value_columns}
+        self.regions = pd.concat(regions, axis=1)
+        self.cities = pd.concat(cities, axis=1)
+
+        self.region_outlier_values = {
+            col: summarize_outliers(df, region_keys, col, stats)
+            for col, stats in regions.items()
+        }
+        self.city_outlier_values = {
+            col: summarize_outliers(df, city_keys, col, stats)
+            for col, stats in cities.items()
+        }
+
+    def region_stats(self, value_col, currency=BASE_CURRENCY):
+        """Get the statistics of a price column per region
+        :param value_col: Price column
+        :param currency: Currency code of the statistics
+        :return: DataFrame indexed by region_name with STATS as columns
+        """
+        return convert_stats(self.regions[value_col], currency)
+
+    def city_stats(self, value_col, currency=BASE_CURRENCY, region=None):
+        """Get the statistics of a price column per city
+        :param value_col: Price column
+        :param currency: Currency code of the statistics
+        :param region: Only return the cities of this region
+        :return: DataFrame indexed by region_name, city_name (or by city_name
+            if a region is given) with STATS as columns
+        """
+        stats = self.cities[value_col]
+        if region is not None:
+            stats = stats.xs(region, level="region_name")
+        return convert_stats(stats, currency)
+
+    def region_outliers(self, value_col, currency=BASE_CURRENCY):
+        """Get the outliers of a price column per region
+        :param value_col: Price column
+        :param currency: Currency code of the outliers
+        :return: DataFrame with region_name and the price column
+        """
+        return convert_outliers(
+            self.region_outlier_values[value_col], value_col, currency
+        )
+
+    def city_outliers(self, value_col, currency=BASE_CURRENCY, region=None):
+        """Get the outliers of a price column per city
+        :param value_col: Price column
+        :param currency: Currency code of the outliers
+        :param region: Only return the outliers of the cities of this region
+        :return: DataFrame with region_name, city_name and the price column
+        """
+        outliers = self.city_outlier_values[value_col]
+        if region is not None:
+            outliers = outliers[outliers["region_name"] == region]
+        return convert_outliers(outliers, value_col, currency)
@@ -0,0 +1,147 @@
+import logging
+import threading
+
+import pandas as pd
+
+from spatial import SpatialIndex
+from stats import StatsCube
+
+logger = logging.getLogger(__name__)
+
+# Number of nearest listings returned when no radius is given
+DEFAULT_NEARBY_K = 50
+
+
+class ListingsStore:
+    """Process-wide, read-only listings shared by every session.
+
+    The frames are built once per snapshot version and handed out by reference,
+    so sessions and pages must not modify them in place.
+    """
+
+    def __init__(self, snapshot):
+        """
+        :param snapshot: ListingsSnapshot object
+        """
+        self.snapshot = snapshot
+        self._source = None
+        self._indexed = None
+        self._locations = {}
+        self._spatial = None
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Rebuild the shared frames if the snapshot changed"""
+        df = self.snapshot.load()
+        with self._lock:
+            if df is self._source:
+                return
+            logger.info("Building shared listings frames")
+
+            # prices stay in the base currency, other currencies are applied
+            # when the prices are aggregated or rendered
+            # sort by location then price so each location is a contiguous,
+            # price-ordered block; the order is the same in every currency
+            indexed = df.set_index(["region_name", "city_name"]).sort_values(
+                by=["region_name", "city_name", "price"]
+            )
+            self._locations = {
+                location: (positions[0], positions[-1] + 1)
+                for location, positions in indexed.groupby(
+                    level=["region_name", "city_name"], sort=False
+                ).indices.items()
+            }
+            self._indexed = indexed
+            self._spatial = SpatialIndex(
+                indexed["latitude"].to_numpy(dtype=float),
+                indexed["longitude"].to_numpy(dtype=float),
+            )
+            self._stats = StatsCube(df)
+            self._source = df
+
+    def listings(self):
+        """Get the listings indexed by region_name and city_name
+        :return: Shared dataframe with region_name, city_name as index, sorted
+            by location and price
+        """
+        self._refresh()
+        return self._indexed
+
+    def location_listings(self, region, city):
+        """Get the listings of a location sorted by price
+        :param region: Region name
+        :param city: City name
+        :return: Shared slice of the listings of the location
+        """
+        self._refresh()
+        start, stop = self._locations.get((region, city), (0, 0))
+        return self._indexed.iloc[start:stop]
+
+    def nearby_listings(self, latitude, longitude, radius_km=None, k=DEFAULT_NEARBY_K):
+        """Get the listings near a point, within a radius or the k nearest
+        :param latitude: Latitude of the point in degrees
+        :param longitude: Longitude of the point in degrees
+        :param radius_km: Radius in km
+        :param k: Number of nearest listings, used when no radius is given
+        :return: Listings sorted by price with a distance_km column
+        """
+        self._refresh()
+        if radius_km is not None:
+            positions, distances = self._spatial.within_radius(
+                latitude, longitude, radius_km
+            )
+        else:
+            positions, distances = self._spatial.nearest(latitude, longitude, k)
+        return (
+            self._indexed.iloc[positions]
+            .assign(distance_km=distances)
+            .sort_values(by=["price"])
+        )
+
+    def flat_listings(self):
+        """Get the listings with region_name and city_name as columns
+        :return: Shared dataframe with a range index
+        """
+        self._refresh()
+        return self._source
+
+    def stats(self):
+        """Get the price statistics cube of the listings
+        :return: Shared StatsCube object
+        """
+        self._refresh()
+        return self._stats
+
+    def is_shared(self, df):
+        """Check if a dataframe is one of the shared frames
+        :param df: DataFrame
+        :return: True if the dataframe is owned by the store
+        """
+        return any(df is frame for frame in (self._source, self._indexed))
+
+    def memory_report(self, session_states=()):
+        """Report the memory used by the shared frames and by each session
+        :param session_states: Iterable of session state mappings
+        :return: Dictionary with the shared bytes and the per-session bytes
+        """
+        shared_bytes = sum(
+            int(frame.memory_usage(deep=True).sum())
+            for frame in (self._source, self._indexed)
+            if frame is not None
+        )
+
+        # Only frames owned by a session count towards its overhead
+        per_session_bytes = [
+            sum(
+                int(value.memory_usage(deep=True).sum())
+                for value in session_state.values()
+                if isinstance(value, pd.DataFrame) and not self.is_shared(value)
+            )
+            for session_state in session_states
+        ]
+        return {
+            "shared_bytes": shared_bytes,
+            "sessions": len(per_session_bytes),
+            "per_session_bytes": per_session_bytes,
+        }
@@ -1,7 +1,6 @@
 from db import Database
+from scraper import ImageCache, cache_images
 import pandas as pd
-import requests
-from io import BytesIO
 
 # to import path from src
 import sys
@@ -12,17 +11,16 @@ db = Database()
 # read csv file
 df = pd.read_csv("../data/csv/cleaned_data.csv")
 
-# loop through each row
-for index, row in df.iterrows():
-    # get the image url
-    img_url = row["Image Link"]
-    # get the image
-    img = requests.get(img_url).content
-    print(img)
-    # convert image to bytes
-    # img_bytes = BytesIO(img)
-    # add new column to dataframe
-    df.loc[index, "img_bytes"] = img
+# fetch the images concurrently, images already in the cache are skipped
+cache = ImageCache()
+failed = cache_images(df["Image Link"], cache)
+print(f"{len(failed)} images could not be fetched")
+
+# store the thumbnails instead of the full-size images
+df["img_bytes"] = df["Image Link"].map(cache.thumbnail)
+
+# track listing changes so the app snapshots only sync what changed
+db.ensure_change_tracking()
 
 # insert data into database
 db.insert_data(df)
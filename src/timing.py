@@ -0,0 +1,75 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Number of most recent samples kept per stage
+DEFAULT_WINDOW = 1000
+
+# Percentiles reported per stage
+PERCENTILES = [50, 95, 99]
+
+
+class LatencyRecorder:
+    """Rolling window of latency samples per stage"""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        """
+        :param window: Number of most recent samples kept per stage
+        """
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        """Record a latency sample
+        :param stage: Name of the stage
+        :param seconds: Duration in seconds
+        """
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Record the duration of the block
+        :param stage: Name of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self):
+        """Get the latency percentiles of each stage
+        :return: Dictionary of stage: {"count", "p50", "p95", "p99"} in milliseconds
+        """
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+
+        summary = {}
+        for stage, values in samples.items():
+            percentiles = np.percentile(np.array(values) * 1000, PERCENTILES)
+            summary[stage] = {"count": len(values)}
+            summary[stage].update(
+                {f"p{p}": value for p, value in zip(PERCENTILES, percentiles)}
+            )
+        return summary
+
+    def log_summary(self):
+        """Log the latency percentiles of each stage"""
+        for stage, stats in self.summary().items():
+            logger.info(
+                f"Latency {stage}: "
+                + ", ".join(f"p{p}={stats[f'p{p}']:.1f}ms" for p in PERCENTILES)
+                + f" (n={stats['count']})"
+            )
+
+
+# Process-wide recorder shared by every session
+latency = LatencyRecorder()
@@ -0,0 +1,480 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+from joblib import Memory
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.linear_model import Lasso, LinearRegression, Ridge
+from sklearn.metrics import (
+    mean_absolute_error,
+    mean_absolute_percentage_error,
+    mean_squared_error,
+    r2_score,
+)
+from sklearn.model_selection import (
+    GridSearchCV,
+    HalvingRandomSearchCV,
+    RandomizedSearchCV,
+    cross_val_score,
+    train_test_split,
+)
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, PolynomialFeatures, StandardScaler
+
+from compiled_model import CompiledForest, compiled_path, source_stamp
+from registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+# Training data and output directory of the model artifacts
+DEFAULT_DATA_PATH = os.path.join(
+    os.path.dirname(__file__), "../data/csv/cleaned_data.csv"
+)
+DEFAULT_MODELS_DIR = os.path.join(os.path.dirname(__file__), "../models")
+
+# Features and target of the model
+NUMERICAL_FEATURES = ["Floor Area", "Lot Area", "Bedrooms"]
+CATEGORICAL_FEATURES = ["Town/City", "Region"]
+TARGET = "Price"
+
+# Seeds of the train/test split and of the search
+SPLIT_RANDOM_STATE = 101
+RANDOM_STATE = 42
+
+# Share of the data held out for the test metrics
+TEST_SIZE = 0.2
+
+# Search strategies supported by the train entry point
+SEARCH_METHODS = ["halving", "random", "grid"]
+
+# Number of cross-validation folds
+DEFAULT_CV = 5
+
+# Number of candidates sampled by the randomized searches
+DEFAULT_N_CANDIDATES = 60
+
+# Maximum number of training rows used by the search, so the search time stays
+# bounded as the dataset grows; the best model is refit on all the rows
+DEFAULT_MAX_SAMPLES = 20000
+
+# Seconds the training is expected to fit in
+DEFAULT_TIME_BUDGET = 600
+
+
+def build_pipeline(memory=None):
+    """Build the preprocessing and regression pipeline of the app's model
+    :param memory: joblib Memory or path used to cache the fitted preprocessor
+    :return: Unfitted Pipeline with preprocessor and classifier steps
+    """
+    numerical_transformer = Pipeline(
+        steps=[
+            ("scaler", StandardScaler()),
+            ("polynomial", PolynomialFeatures(degree=2, include_bias=False)),
+        ]
+    )
+    # Sparse output keeps the one-hot encoded cities cheap to build and to copy
+    categorical_transformer = Pipeline(
+        steps=[
+            (
+                "ohe",
+                OneHotEncoder(
+                    handle_unknown="ignore", sparse_output=True, drop="first"
+                ),
+            )
+        ]
+    )
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ("num", numerical_transformer, NUMERICAL_FEATURES),
+            ("cat", categorical_transformer, CATEGORICAL_FEATURES),
+        ]
+    )
+    return Pipeline(
+        steps=[
+            ("preprocessor", preprocessor),
+            ("classifier", RandomForestRegressor(random_state=RANDOM_STATE)),
+        ],
+        memory=memory,
+    )
+
+
+def get_parameters():
+    """Get the search space of every estimator family
+    :return: list of parameter dictionaries
+    """
+    # Common parameters for all models
+    common_params = {
+        "preprocessor__num__polynomial__degree": [1, 2, 3, 4],
+        "preprocessor__num__polynomial__interaction_only": [False, True],
+    }
+    return [
+        {
+            **common_params,
+            "classifier": [Lasso(random_state=RANDOM_STATE)],
+            "classifier__alpha": [1.0, 0.001, 0.1, 0.01, 0.05, 10],
+            "classifier__max_iter": [1_000, 500, 100, 10],
+        },
+        {
+            **common_params,
+            "classifier": [Ridge(random_state=RANDOM_STATE)],
+            "classifier__alpha": [1.0, 0.001, 0.1, 0.01, 0.05, 10],
+            "classifier__max_iter": [1_000, 500, 100, 10],
+        },
+        {
+            **common_params,
+            "classifier": [RandomForestRegressor(random_state=RANDOM_STATE)],
+            "classifier__max_depth": [5, 10],
+            "classifier__n_estimators": [5, 10, 20, 50, 100],
+        },
+        {
+            **common_params,
+            "classifier": [LinearRegression()],
+        },
+    ]
+
+
+def build_search(
+    pipeline,
+    params,
+    method="halving",
+    cv=DEFAULT_CV,
+    n_candidates=DEFAULT_N_CANDIDATES,
+    max_samples=DEFAULT_MAX_SAMPLES,
+    n_jobs=-1,
+):
+    """Build the hyperparameter search over the pipeline
+    :param pipeline: Pipeline returned by build_pipeline
+    :param params: Parameter dictionary, or list of them except for halving
+    :param method: One of SEARCH_METHODS
+    :param cv: Number of cross-validation folds
+    :param n_candidates: Number of candidates of the randomized searches
+    :param max_samples: Maximum number of rows used by the successive halving
+    :param n_jobs: Number of parallel jobs
+    :return: Unfitted search object
+    """
+    common = dict(scoring="r2", cv=cv, n_jobs=n_jobs, refit=False, verbose=1)
+    if method == "halving":
+        # Successive halving scores many candidates on few rows and only
+        # gives the full max_samples rows to the best ones
+        return HalvingRandomSearchCV(
+            pipeline,
+            params,
+            n_candidates=n_candidates,
+            resource="n_samples",
+            max_resources=max_samples,
+            random_state=RANDOM_STATE,
+            **common,
+        )
+    if method == "random":
+        return RandomizedSearchCV(
+            pipeline,
+            params,
+            n_iter=n_candidates,
+            random_state=RANDOM_STATE,
+            **common,
+        )
+    if method == "grid":
+        return GridSearchCV(pipeline, params, **common)
+    raise ValueError(
+        f"Unknown search method {method}, expected one of {SEARCH_METHODS}"
+    )
+
+
+def select_best(searches, X, y, cv, max_samples, n_jobs=-1):
+    """Pick the best candidate of one or more fitted searches
+    :param searches: Fitted search objects
+    :param X: Features the searches were fitted on
+    :param y: Log prices the searches were fitted on
+    :param cv: Number of cross-validation folds
+    :param max_samples: Maximum number of rows used to compare the candidates
+    :param n_jobs: Number of parallel jobs
+    :return: Parameters and cross-validated r2 of the best candidate
+    """
+    if len(searches) == 1:
+        return searches[0].best_params_, searches[0].best_score_
+
+    # Successive halving scores the last candidates of each search on a
+    # different number of rows, so the winners are scored again on the same rows
+    if len(X) > max_samples:
+        X = X.sample(n=max_samples, random_state=RANDOM_STATE)
+        y = y.loc[X.index]
+    scores = [
+        cross_val_score(
+            build_pipeline().set_params(**search.best_params_),
+            X,
+            y,
+            scoring="r2",
+            cv=cv,
+            n_jobs=n_jobs,
+        ).mean()
+        for search in searches
+    ]
+    best = int(np.argmax(scores))
+    return searches[best].best_params_, scores[best]
+
+
+def evaluate(model, X, y):
+    """Compute the test metrics of a fitted model
+    :param model: Fitted pipeline predicting the log price
+    :param X: Features
+    :param y: Prices
+    :return: Dictionary of metrics, on the log scale and on the price scale
+    """
+    y_log = np.log1p(y)
+    y_pred_log = model.predict(X)
+    y_pred = np.expm1(y_pred_log)
+    return {
+        "r2_log": float(r2_score(y_log, y_pred_log)),
+        "rmsle": float(np.sqrt(mean_squared_error(y_log, y_pred_log))),
+        "r2": float(r2_score(y, y_pred)),
+        "mae": float(mean_absolute_error(y, y_pred)),
+        "mape": float(mean_absolute_percentage_error(y, y_pred) * 100),
+    }
+
+
+def file_digest(path):
+    """Get the SHA-256 of a file
+    :param path: Path of the file
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def describe_params(params):
+    """Make the best parameters JSON serializable
+    :param params: Dictionary of parameters
+    :return: Dictionary with estimators replaced by their class name
+    """
+    return {
+        name: (
+            type(value).__name__
+            if isinstance(value, sklearn.base.BaseEstimator)
+            else value
+        )
+        for name, value in params.items()
+    }
+
+
+def save_artifact(model, report, models_dir=DEFAULT_MODELS_DIR):
+    """Write the model and its report under a new version
+    :param model: Fitted pipeline
+    :param report: Dictionary of the training report
+    :param models_dir: Directory of the model artifacts
+    :return: Path of the model artifact
+    """
+    version = report["version"]
+    os.makedirs(models_dir, exist_ok=True)
+    model_path = os.path.join(models_dir, f"model-{version}.pkl")
+    report_path = os.path.join(models_dir, f"model-{version}.json")
+
+    # Write to temporary files first so readers never see a partial artifact
+    with open(f"{model_path}.tmp", "wb") as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(f"{report_path}.tmp", "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(f"{model_path}.tmp", model_path)
+    os.replace(f"{report_path}.tmp", report_path)
+    logger.info(f"Saved model {version} to {model_path}")
+
+    # Forests also get a compiled artifact that the app can memory-map
+    try:
+        compiled = CompiledForest(model)
+        if compiled.check_parity(model, compiled.sample_inputs()):
+            compiled.save(compiled_path(model_path), source=source_stamp(model_path))
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        logger.info(f"Model {version} has no compiled artifact: {e}")
+    return model_path
+
+
+def train(
+    data_path=DEFAULT_DATA_PATH,
+    models_dir=DEFAULT_MODELS_DIR,
+    method="halving",
+    cv=DEFAULT_CV,
+    n_candidates=DEFAULT_N_CANDIDATES,
+    max_samples=DEFAULT_MAX_SAMPLES,
+    time_budget=DEFAULT_TIME_BUDGET,
+    n_jobs=-1,
+    activate=True,
+):
+    """Search the best model, refit it on the training rows and register it
+    :param data_path: CSV file of the cleaned listings
+    :param models_dir: Directory of the model artifacts
+    :param method: One of SEARCH_METHODS
+    :param cv: Number of cross-validation folds
+    :param n_candidates: Number of candidates of the randomized searches
+    :param max_samples: Maximum number of rows used by the search
+    :param time_budget: Seconds the training is expected to fit in
+    :param n_jobs: Number of parallel jobs
+    :param activate: Make the new model the active version of the registry
+    :return: Path of the model artifact and the training report
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    df = pd.read_csv(data_path)
+    X = df[NUMERICAL_FEATURES + CATEGORICAL_FEATURES]
+    y = df[TARGET]
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZE, random_state=SPLIT_RANDOM_STATE
+    )
+    y_train_log = np.log1p(y_train)
+    timings["load"] = time.perf_counter() - start
+
+    # The exhaustive and randomized searches have no resource to grow, so
+    # they search on a fixed-size sample of the training rows instead
+    X_search, y_search = X_train, y_train_log
+    max_samples = min(max_samples, len(X_train))
+    if method != "halving" and len(X_train) > max_samples:
+        X_search = X_train.sample(n=max_samples, random_state=RANDOM_STATE)
+        y_search = y_train_log.loc[X_search.index]
+
+    # HalvingRandomSearchCV only takes a list of parameter dictionaries from
+    # scikit-learn 1.4 on, so successive halving runs once per estimator family
+    if method == "halving":
+        param_spaces = get_parameters()
+        family_candidates = max(1, n_candidates // len(param_spaces))
+    else:
+        param_spaces = [get_parameters()]
+        family_candidates = n_candidates
+
+    # Cache the fitted preprocessor of each fold, so candidates that only
+    # differ in the classifier do not refit it
+    cache_dir = tempfile.mkdtemp(prefix="train-cache-")
+    step = time.perf_counter()
+    try:
+        searches = []
+        for params in param_spaces:
+            search = build_search(
+                build_pipeline(Memory(location=cache_dir, verbose=0)),
+                params,
+                method=method,
+                cv=cv,
+                n_candidates=family_candidates,
+                max_samples=max_samples,
+                n_jobs=n_jobs,
+            )
+            search.fit(X_search, y_search)
+            searches.append(search)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    best_params, best_score = select_best(
+        searches, X_search, y_search, cv, max_samples, n_jobs
+    )
+    timings["search"] = time.perf_counter() - step
+
+    # Refit the best candidate on all the training rows, without the cache
+    step = time.perf_counter()
+    model = build_pipeline().set_params(**best_params)
+    model.fit(X_train, y_train_log)
+    timings["refit"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    metrics = {
+        "train": evaluate(model, X_train, y_train),
+        "test": evaluate(model, X_test, y_test),
+        "cv_r2": float(best_score),
+    }
+    timings["evaluate"] = time.perf_counter() - step
+    timings["total"] = time.perf_counter() - start
+
+    if timings["total"] > time_budget:
+        logger.warning(
+            f"Training took {timings['total']:.0f}s, over the {time_budget}s budget; "
+            "lower max_samples or n_candidates"
+        )
+
+    report = {
+        "version": datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+        "data": {
+            "path": os.path.abspath(data_path),
+            "sha256": file_digest(data_path),
+            "rows": len(df),
+            "train_rows": len(X_train),
+            "test_rows": len(X_test),
+        },
+        "search": {
+            "method": method,
+            "cv": cv,
+            "n_candidates": sum(
+                len(search.cv_results_["params"]) for search in searches
+            ),
+            "max_samples": max_samples,
+            "best_params": describe_params(best_params),
+        },
+        "features": {
+            "columns": NUMERICAL_FEATURES + CATEGORICAL_FEATURES,
+            "numerical": NUMERICAL_FEATURES,
+            "categorical": CATEGORICAL_FEATURES,
+            "target": TARGET,
+        },
+        "metrics": metrics,
+        "timings": timings,
+        "time_budget": time_budget,
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "scikit-learn": sklearn.__version__,
+        },
+    }
+    logger.info(
+        f"Best model {report['search']['best_params']} test r2 "
+        f"{metrics['test']['r2_log']:.4f} in {timings['total']:.1f}s"
+    )
+    model_path = save_artifact(model, report, models_dir)
+    ModelRegistry(models_dir).register(model_path, report, activate=activate)
+    return model_path, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the house price model")
+    parser.add_argument("--data", default=DEFAULT_DATA_PATH)
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--search", choices=SEARCH_METHODS, default="halving")
+    parser.add_argument("--cv", type=int, default=DEFAULT_CV)
+    parser.add_argument("--n-candidates", type=int, default=DEFAULT_N_CANDIDATES)
+    parser.add_argument("--max-samples", type=int, default=DEFAULT_MAX_SAMPLES)
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_TIME_BUDGET)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument(
+        "--no-activate",
+        action="store_true",
+        help="register the model without making it the active version",
+    )
+    args = parser.parse_args()
+
+    model_path, report = train(
+        data_path=args.data,
+        models_dir=args.models_dir,
+        method=args.search,
+        cv=args.cv,
+        n_candidates=args.n_candidates,
+        max_samples=args.max_samples,
+        time_budget=args.time_budget,
+        n_jobs=args.n_jobs,
+        activate=not args.no_activate,
+    )
+    print(json.dumps({"model": model_path, **report}, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
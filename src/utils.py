@@ -1,42 +1,29 @@
-import random
-from forex_python.converter import CurrencyRates
-import logging
+from fx import get_rate_provider
+
+# Currency the listings and the model prices are stored in
+BASE_CURRENCY = "PHP"
+
+# Supported currencies and their symbols
+CURRENCY_SYMBOLS = {
+    "PHP": "₱",
+    "EUR": "€",
+    "USD": "$",
+    "SGD": "S$",
+    "JPY": "¥",
+}
 
 
 def get_header():
     """Gets a random user agent and returns it as a header.
 
+    The user agents are read once and kept in memory by the shared pool.
     :return: A dictionary containing the header with a User-Agent
     :rtype: dict
     """
-    agent_list = []
-
-    # List of browsers (each browser has a text file with UA)
-    browser_list = [
-        "Firefox",
-        "Internet+Explorer",
-        "Opera",
-        "Safari",
-        "Chrome",
-        "Edge",
-        "Android+Webkit+Browser",
-    ]
-
-    # Randomly select which file browser to read
-    browser = random.choice(browser_list)
-
-    # File path
-    file_path = f"../data/user_agents/{browser}.txt"
-
-    with open(file_path, "r") as file:
-        for line in file:
-            if not line.startswith("More"):
-                # Remove newline character and leading/trailing whitespace
-                cleaned_line = line.strip()
-                agent_list.append(cleaned_line)
-    user_agent = random.choice(agent_list)
-    header = {"User-Agent": user_agent}
-    return header
+    # Imported here so the app does not load the scraper's dependencies
+    from scraper.agents import get_user_agent_pool
+
+    return get_user_agent_pool().header()
 
 
 def write_file(text, filename):
@@ -60,49 +47,27 @@ def read_file(filename):
 def formatPrice(price, currency):
     """Format price to add commas and currency symbol
     :param price: price to be formatted
+    :param currency: currency code of the price
     :return: formatted price
     """
-    c = CurrencyRates()
-    if currency == "EUR":
-        return "€" + "{:,.0f}".format(price)
-    elif currency == "PHP":
-        return "₱" + "{:,.0f}".format(price)
-
-
-# def convert_currency(df, new_currency):
-#     c = CurrencyRates()
-#     if new_currency == "EUR":
-#         df["price"] = df["price"].apply(lambda x: c.convert("PHP", "EUR", x))
-#     elif new_currency == "PHP":
-#         df["price"] = df["price"].apply(lambda x: c.convert("EUR", "PHP", x))
-#     return df
-
-
-def add_eur_price(df):
-    c = CurrencyRates()
-    # get the conversion
-    conversion = c.get_rate("PHP", "EUR")
-    logging.info(f"Conversion rate: {conversion}")
-
-    df["price_eur"] = df["price"] * conversion
-    df["price_per_sqm_eur"] = df["price_per_sqm"] * conversion
-    return df
-
-
-def convert_to_eur(price):
-    logging.info("Converting currency")
-    c = CurrencyRates()
-    return c.convert("PHP", "EUR", price)
-
-
-def update_currency(sel_currency):
-    if sel_currency == "PHP":
-        currency = "PHP"
-        price_col = "price"
-        price_sqm = "price_per_sqm"
-    else:
-        currency = "EUR"
-        price_col = "price_eur"
-        price_sqm = "price_per_sqm_eur"
-
-    return currency, price_col, price_sqm
+    return CURRENCY_SYMBOLS[currency] + "{:,.0f}".format(price)
+
+
+def format_prices(prices, currency):
+    """Format a Series of prices to add commas and currency symbol
+    :param prices: Series of prices to be formatted
+    :param currency: currency code of the prices
+    :return: Series of formatted prices
+    """
+    return CURRENCY_SYMBOLS[currency] + prices.map("{:,.0f}".format)
+
+
+def convert_price(price, currency):
+    """Convert prices stored in the base currency to another currency
+    :param price: price, array, Series or DataFrame of prices in BASE_CURRENCY
+    :param currency: currency code to convert to
+    :return: converted price(s), of the same type as the input
+    """
+    if currency == BASE_CURRENCY:
+        return price
+    return price * get_rate_provider().get_rate(BASE_CURRENCY, currency)
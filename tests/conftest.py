@@ -0,0 +1,90 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+# The app modules import each other by their flat names from src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../src"))
+
+
+class StubServer:
+    """Local HTTP server answering each path with a scripted list of responses.
+
+    Responses are (status, headers, body) tuples served in order; the last one
+    is repeated once the list runs out. A route may instead be a callable of
+    the query string returning the response. Every request is recorded with its
+    path, query and arrival time.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                with stub._lock:
+                    stub.requests.append((parts.path, parts.query, time.monotonic()))
+                    responses = stub.routes.get(parts.path, [(404, {}, b"")])
+                    if callable(responses):
+                        response = responses
+                    else:
+                        response = (
+                            responses.pop(0) if len(responses) > 1 else responses[0]
+                        )
+                status, headers, body = (
+                    response(parts.query) if callable(response) else response
+                )
+                if isinstance(body, str):
+                    body = body.encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+
+    def route(self, path, *responses):
+        """Script the responses of a path
+        :param path: URL path
+        :param responses: (status, headers, body) tuples, or a single callable
+            of the query string returning one
+        """
+        if len(responses) == 1 and callable(responses[0]):
+            self.routes[path] = responses[0]
+        else:
+            self.routes[path] = list(responses)
+
+    def hits(self, path):
+        """Get the requests made to a path
+        :param path: URL path
+        :return: List of (path, query, time) tuples
+        """
+        return [request for request in self.requests if request[0] == path]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
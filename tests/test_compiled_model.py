@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from compiled_model import CompiledForest
+from train import build_pipeline
+
+# Locations of the synthetic training rows
+LOCATIONS = [
+    ("Lipa", "Batangas"),
+    ("Tanauan", "Batangas"),
+    ("Quezon City", "Metro Manila"),
+    ("Makati", "Metro Manila"),
+    ("Cebu City", "Cebu"),
+]
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    rng = np.random.default_rng(0)
+    n_rows = 300
+    cities, regions = zip(*(LOCATIONS[i % len(LOCATIONS)] for i in range(n_rows)))
+    X = pd.DataFrame(
+        {
+            "Floor Area": rng.integers(30, 400, n_rows).astype(float),
+            "Lot Area": rng.integers(50, 800, n_rows).astype(float),
+            "Bedrooms": rng.integers(1, 7, n_rows).astype(float),
+            "Town/City": cities,
+            "Region": regions,
+        }
+    )
+    y = 20000 * X["Floor Area"] + 5000 * X["Lot Area"] + rng.normal(0, 1e5, n_rows)
+    model = build_pipeline()
+    model.set_params(classifier__n_estimators=20, classifier__max_depth=8)
+    return model.fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def compiled(pipeline):
+    return CompiledForest(pipeline)
+
+
+def edge_inputs():
+    """Rows the app can send that the training data never had"""
+    return pd.DataFrame(
+        {
+            "Floor Area": [0.0, 0.0, 120.0, 80.0],
+            "Lot Area": [0.0, 150.0, 0.0, 200.0],
+            "Bedrooms": [0.0, 3.0, 2.0, 4.0],
+            "Town/City": ["Lipa", "Atlantis", "Makati", "Atlantis"],
+            "Region": ["Batangas", "Batangas", "Atlantis", "Atlantis"],
+        }
+    )
+
+
+def test_parity_on_sample_inputs(pipeline, compiled):
+    assert compiled.check_parity(pipeline, compiled.sample_inputs())
+
+
+def test_parity_on_edge_inputs(pipeline, compiled):
+    assert compiled.check_parity(pipeline, edge_inputs())
+
+
+def test_parity_after_save_and_load(pipeline, compiled, tmp_path):
+    compiled.save(tmp_path / "model.compiled")
+    loaded = CompiledForest.load(tmp_path / "model.compiled", mmap_mode="r")
+    input_df = pd.concat(
+        [compiled.sample_inputs(n_rows=50), edge_inputs()], ignore_index=True
+    )
+    assert loaded.check_parity(pipeline, input_df)
@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+
+import pytest
+
+from fx import FALLBACK_RATES, ForexRateSource, RateProvider, StaticRateSource
+
+
+class RemoteSource:
+    """Remote-like source whose fetches wait until released"""
+
+    is_remote = True
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.release = threading.Event()
+        self.calls = 0
+
+    def get_rate(self, base, target):
+        self.calls += 1
+        if not self.release.wait(5):
+            raise TimeoutError("never released")
+        if isinstance(self.rate, Exception):
+            raise self.rate
+        return self.rate
+
+
+def wait_for(condition, timeout=5):
+    # perf_counter, since some tests replace time.monotonic
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def rates_path(tmp_path):
+    return str(tmp_path / "fx_rates.json")
+
+
+def test_serves_fallback_until_the_first_fetch(rates_path):
+    source = RemoteSource(0.02)
+    provider = RateProvider(source, path=rates_path)
+    assert provider.get_rate("PHP", "USD") == FALLBACK_RATES[("PHP", "USD")]
+
+    source.release.set()
+    wait_for(lambda: provider.get_rate("PHP", "USD") == 0.02)
+    assert source.calls == 1
+
+
+def test_failed_fetch_keeps_the_fallback_and_retries(rates_path):
+    source = RemoteSource(ConnectionError("offline"))
+    source.release.set()
+    provider = RateProvider(source, path=rates_path)
+    assert provider.get_rate("PHP", "EUR") == FALLBACK_RATES[("PHP", "EUR")]
+    wait_for(lambda: not provider._refreshing)
+
+    # The failed refresh no longer blocks the next one
+    source.rate = 0.015
+    provider.get_rate("PHP", "EUR")
+    wait_for(lambda: provider.get_rate("PHP", "EUR") == 0.015)
+    assert source.calls == 2
+
+
+def test_refreshes_after_the_ttl(rates_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    source = StaticRateSource({("PHP", "USD"): 0.02})
+    provider = RateProvider(source, ttl=60, path=rates_path)
+    assert provider.get_rate("PHP", "USD") == 0.02
+
+    source.rates[("PHP", "USD")] = 0.03
+    now[0] += 59
+    assert provider.get_rate("PHP", "USD") == 0.02
+
+    # An expired rate is still served while the new one is fetched
+    now[0] += 2
+    assert provider.get_rate("PHP", "USD") == 0.02
+    wait_for(lambda: provider.get_rate("PHP", "USD") == 0.03)
+
+
+def test_persists_and_reloads_the_rates(rates_path):
+    provider = RateProvider(StaticRateSource({("PHP", "USD"): 0.021}), path=rates_path)
+    provider.get_rate("PHP", "USD")
+    with open(rates_path) as f:
+        assert json.load(f) == {"PHP/USD": 0.021}
+
+    # A restarted provider serves the saved rate while refreshing it
+    source = RemoteSource(0.022)
+    restarted = RateProvider(source, path=rates_path)
+    assert restarted.get_rate("PHP", "USD") == 0.021
+    source.release.set()
+    wait_for(lambda: restarted.get_rate("PHP", "USD") == 0.022)
+
+
+def test_forex_source_times_out(stub_server):
+    def slow(query):
+        time.sleep(1)
+        return 200, {}, json.dumps({"rates": {"USD": 0.02}})
+
+    stub_server.route("/api/latest", slow)
+    source = ForexRateSource(url=f"{stub_server.url}/api/latest", timeout=0.2)
+    provider = RateProvider(source, path=None)
+    start = time.monotonic()
+    assert provider.refresh("PHP", "USD") is None
+    assert time.monotonic() - start < 0.9
+    assert not provider._refreshing
+
+
+def test_forex_source_reads_the_rate(stub_server):
+    stub_server.route(
+        "/api/latest", (200, {}, json.dumps({"base": "PHP", "rates": {"USD": 0.02}}))
+    )
+    source = ForexRateSource(url=f"{stub_server.url}/api/latest")
+    assert source.get_rate("PHP", "USD") == 0.02
+    assert stub_server.requests[0][1] == "base=PHP&symbols=USD&rtype=fpy"
@@ -0,0 +1,86 @@
+import os
+from io import BytesIO
+
+import pandas as pd
+from PIL import Image
+
+from scraper import ImageCache, cache_images
+from scraper.images import THUMBNAIL_SIZE
+
+
+def make_image(color, size=(800, 600)):
+    """Encode a plain PNG image
+    :param color: RGB color of the image
+    :param size: Width and height of the image
+    :return: Bytes of the image
+    """
+    output = BytesIO()
+    Image.new("RGB", size, color).save(output, format="PNG")
+    return output.getvalue()
+
+
+def thumbnail_files(cache):
+    return sorted(name for name in os.listdir(cache.directory) if name.endswith(".jpg"))
+
+
+def test_same_image_is_stored_once(stub_server, tmp_path):
+    red, blue = make_image((255, 0, 0)), make_image((0, 0, 255))
+    stub_server.route("/a.png", (200, {}, red))
+    stub_server.route("/b.png", (200, {}, red))
+    stub_server.route("/c.png", (200, {}, blue))
+    urls = [f"{stub_server.url}/{name}" for name in ("a.png", "b.png", "c.png")]
+
+    cache = ImageCache(directory=str(tmp_path))
+    assert cache_images(urls, cache, rate_limit=None) == []
+    assert len(thumbnail_files(cache)) == 2
+    assert cache.thumbnail(urls[0]) == cache.thumbnail(urls[1])
+    assert cache.thumbnail(urls[0]) != cache.thumbnail(urls[2])
+
+
+def test_cached_images_are_not_fetched_again(stub_server, tmp_path):
+    stub_server.route("/a.png", (200, {}, make_image((0, 255, 0))))
+    stub_server.route("/b.png", (200, {}, make_image((0, 0, 0))))
+    url_a, url_b = f"{stub_server.url}/a.png", f"{stub_server.url}/b.png"
+
+    assert cache_images([url_a], ImageCache(directory=str(tmp_path))) == []
+
+    # A new cache reads the saved index, so only the new URL is fetched
+    cache = ImageCache(directory=str(tmp_path))
+    assert url_a in cache
+    assert cache_images([url_a, url_b, url_b], cache, rate_limit=None) == []
+    assert len(stub_server.hits("/a.png")) == 1
+    assert len(stub_server.hits("/b.png")) == 1
+
+
+def test_failed_images_are_reported_and_not_cached(stub_server, tmp_path):
+    stub_server.route("/missing.png", (404, {}, b""))
+    url = f"{stub_server.url}/missing.png"
+
+    cache = ImageCache(directory=str(tmp_path))
+    assert cache_images([url], cache, rate_limit=None) == [url]
+    assert url not in cache
+    assert cache.thumbnail(url) is None
+
+
+def test_thumbnails_have_the_fixed_size(stub_server, tmp_path):
+    stub_server.route("/wide.png", (200, {}, make_image((1, 2, 3), (1600, 400))))
+    stub_server.route("/tall.png", (200, {}, make_image((4, 5, 6), (300, 900))))
+    urls = [f"{stub_server.url}/wide.png", f"{stub_server.url}/tall.png"]
+
+    cache = ImageCache(directory=str(tmp_path))
+    cache_images(urls, cache, rate_limit=None)
+    for url in urls:
+        with Image.open(BytesIO(cache.thumbnail(url))) as thumbnail:
+            assert thumbnail.format == "JPEG"
+            assert thumbnail.size == THUMBNAIL_SIZE
+
+
+def test_image_urls_point_to_the_cached_thumbnails(stub_server, tmp_path):
+    stub_server.route("/a.png", (200, {}, make_image((9, 9, 9))))
+    cached, missing = f"{stub_server.url}/a.png", f"{stub_server.url}/b.png"
+
+    cache = ImageCache(directory=str(tmp_path), static_url="app/static/thumbs")
+    cache_images([cached], cache, rate_limit=None)
+    image_urls = cache.image_urls(pd.Series([cached, missing]))
+    digest = thumbnail_files(cache)[0]
+    assert image_urls.tolist() == [f"app/static/thumbs/{digest}", missing]
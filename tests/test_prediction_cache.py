@@ -0,0 +1,107 @@
+import time
+
+import numpy as np
+import pytest
+
+from model import HousePricePredictor, LoadedModel, PredictionCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace time.monotonic with a clock advanced by the test"""
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_evicts_least_recently_used():
+    cache = PredictionCache(maxsize=2, ttl=None)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.info()["evictions"] == 1
+    assert cache.info()["size"] == 2
+
+
+def test_put_refreshes_recency():
+    cache = PredictionCache(maxsize=2, ttl=None)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("a", 10)
+    cache.put("c", 3)
+    assert cache.get("a") == 10
+    assert cache.get("b") is None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PredictionCache(maxsize=10, ttl=60)
+    cache.put("a", 1)
+    clock[0] += 59
+    assert cache.get("a") == 1
+    clock[0] += 1
+    assert cache.get("a") is None
+    assert cache.info()["size"] == 0
+
+
+def test_counts_hits_and_misses(clock):
+    cache = PredictionCache(maxsize=10, ttl=60)
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("a") == 1
+    clock[0] += 120
+    assert cache.get("a") is None
+    info = cache.info()
+    assert (info["hits"], info["misses"], info["evictions"]) == (2, 2, 0)
+
+
+class FakeModel:
+    """Model predicting the log price from the floor area, counting its calls"""
+
+    def __init__(self, offset=0.0):
+        self.offset = offset
+        self.calls = 0
+
+    def predict(self, input_df):
+        self.calls += 1
+        return np.log1p(1000 * input_df["Floor Area"].astype(float)) + self.offset
+
+
+def predictor_with(version, model):
+    predictor = HousePricePredictor(registry=None, check_interval=3600)
+    predictor.active = LoadedModel(version, None, model, None)
+    predictor._last_check = time.monotonic()
+    return predictor
+
+
+def test_equal_inputs_share_a_cache_entry():
+    model = FakeModel()
+    predictor = predictor_with("v1", model)
+    first = predictor.predict_price(3, 100, 200, "Lipa", "Batangas")
+    second = predictor.predict_price(3.0, "100", 200.0, "Lipa", "Batangas")
+    assert first == second
+    assert model.calls == 1
+    assert predictor.cache_info()["hits"] == 1
+
+
+def test_fractional_inputs_are_not_truncated():
+    model = FakeModel()
+    predictor = predictor_with("v1", model)
+    predictor.predict_price(2, 100, 200, "Lipa", "Batangas")
+    predictor.predict_price(2.5, 100, 200, "Lipa", "Batangas")
+    assert model.calls == 2
+
+
+def test_cache_key_includes_the_model_version():
+    predictor = predictor_with("v1", FakeModel())
+    old_price = predictor.predict_price(3, 100, 200, "Lipa", "Batangas")
+
+    new_model = FakeModel(offset=1.0)
+    predictor.active = LoadedModel("v2", None, new_model, None)
+    new_price = predictor.predict_price(3, 100, 200, "Lipa", "Batangas")
+    assert new_model.calls == 1
+    assert new_price != old_price
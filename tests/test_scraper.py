@@ -0,0 +1,135 @@
+import asyncio
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from scraper import (
+    AsyncFetcher,
+    FetchError,
+    HostRateLimiter,
+    PageCheckpoint,
+    run_sync,
+    scrape,
+)
+
+# Search results page with the pagination select the scraper reads
+RESULTS_PAGE = """<html><body>
+<select class="js-pagination-dropdown" data-pagination-end="{last_page}"></select>
+<p>page {page}</p>
+</body></html>"""
+
+
+def fetch(url, **fetcher_options):
+    fetcher_options.setdefault("rate_limit", None)
+
+    async def run():
+        async with AsyncFetcher(**fetcher_options) as fetcher:
+            return await fetcher.fetch(url)
+
+    return asyncio.run(run())
+
+
+def test_retries_server_errors(stub_server):
+    stub_server.route(
+        "/page",
+        (503, {}, "busy"),
+        (500, {}, "error"),
+        (200, {}, "ok"),
+    )
+    assert fetch(f"{stub_server.url}/page", retries=2, backoff=0.01) == "ok"
+    assert len(stub_server.hits("/page")) == 3
+
+
+def test_gives_up_after_the_retries(stub_server):
+    stub_server.route("/page", (503, {}, "busy"))
+    with pytest.raises(FetchError):
+        fetch(f"{stub_server.url}/page", retries=2, backoff=0.01)
+    assert len(stub_server.hits("/page")) == 3
+
+
+def test_does_not_retry_client_errors(stub_server):
+    stub_server.route("/page", (404, {}, "missing"))
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch(f"{stub_server.url}/page", retries=2, backoff=0.01)
+    assert len(stub_server.hits("/page")) == 1
+
+
+def test_honors_retry_after(stub_server):
+    stub_server.route(
+        "/page",
+        (429, {"Retry-After": "1"}, "slow down"),
+        (200, {}, "ok"),
+    )
+    assert fetch(f"{stub_server.url}/page", retries=1, backoff=0.0) == "ok"
+    first, second = stub_server.hits("/page")
+    assert second[2] - first[2] >= 0.9
+
+
+def test_rate_limits_each_host(stub_server):
+    stub_server.route("/page", (200, {}, "ok"))
+
+    async def run():
+        async with AsyncFetcher(concurrency=8, rate_limit=10) as fetcher:
+            await asyncio.gather(
+                *(fetcher.fetch(f"{stub_server.url}/page") for _ in range(5))
+            )
+
+    asyncio.run(run())
+    times = sorted(hit[2] for hit in stub_server.hits("/page"))
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert min(gaps) >= 0.08
+
+
+def test_rate_limiter_hosts_are_independent():
+    async def run():
+        limiter = HostRateLimiter(rate_limit=10)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await limiter.wait("a")
+        await limiter.wait("b")
+        other_host = loop.time() - start
+        await limiter.wait("a")
+        return other_host, loop.time() - start
+
+    other_host, same_host = asyncio.run(run())
+    assert other_host < 0.05
+    assert same_host >= 0.09
+
+
+def test_checkpoint_resumes_interrupted_scrape(stub_server, tmp_path):
+    failing = {3}
+
+    def results(query):
+        page = int(parse_qs(query)["page"][0])
+        if page in failing:
+            return 500, {}, "error"
+        return 200, {}, RESULTS_PAGE.format(last_page=5, page=page)
+
+    stub_server.route("/house/buy/", results)
+    url = f"{stub_server.url}/house/buy/"
+    directory = str(tmp_path / "html")
+
+    failed = scrape(url, directory, retries=0, rate_limit=None)
+    assert failed == [3]
+    assert PageCheckpoint(directory).done() == {1, 2, 4, 5}
+
+    # The next run only fetches the page missing from the checkpoint
+    failing.clear()
+    stub_server.requests.clear()
+    assert scrape(url, directory, retries=0, rate_limit=None) == []
+    assert [hit[1] for hit in stub_server.hits("/house/buy/")] == ["page=3"]
+    checkpoint = PageCheckpoint(directory)
+    assert checkpoint.done() == {1, 2, 3, 4, 5}
+    assert "page 3" in checkpoint.load(3)
+
+
+def test_run_sync_inside_a_running_loop():
+    async def answer():
+        return 42
+
+    async def notebook_cell():
+        return run_sync(answer())
+
+    assert run_sync(answer()) == 42
+    assert asyncio.run(notebook_cell()) == 42
@@ -0,0 +1,146 @@
+import os
+
+import pandas as pd
+import pyarrow.feather as feather
+import pytest
+
+from snapshot import ListingsSnapshot
+
+
+class FakeDatabase:
+    """In-memory listing table with the interface ListingsSnapshot reads.
+
+    Each row has an updated_at time; the clock only moves when the test
+    advances it, like the database clock between two version checks.
+    """
+
+    def __init__(self):
+        self.now = 100.0
+        self.rows = {}
+        self.calls = []
+
+    def upsert(self, listing_id, price, updated_at=None):
+        self.rows[listing_id] = {
+            "listing_id": listing_id,
+            "price": float(price),
+            "lot_area": 100.0,
+            "updated_at": self.now if updated_at is None else updated_at,
+        }
+
+    def delete(self, listing_id):
+        del self.rows[listing_id]
+
+    def _frame(self, rows):
+        columns = ["listing_id", "price", "lot_area"]
+        return pd.DataFrame(list(rows), columns=columns + ["updated_at"])[columns]
+
+    def get_listings_version(self):
+        updated = [row["updated_at"] for row in self.rows.values()]
+        return {
+            "row_count": len(self.rows),
+            "max_updated_at": max(updated, default=0.0),
+            "recent_count": 0,
+            "checked_at": self.now,
+        }
+
+    def query_listings(self):
+        self.calls.append("full")
+        return self._frame(self.rows.values())
+
+    def query_listings_delta(self, watermark):
+        self.calls.append(("delta", watermark))
+        return self._frame(
+            row for row in self.rows.values() if row["updated_at"] > watermark
+        )
+
+    def get_listing_ids(self):
+        self.calls.append("ids")
+        return list(self.rows)
+
+
+@pytest.fixture
+def db():
+    db = FakeDatabase()
+    for listing_id in (1, 2, 3):
+        db.upsert(listing_id, listing_id * 1e6)
+    return db
+
+
+@pytest.fixture
+def snapshot(db, tmp_path):
+    snapshot = ListingsSnapshot(db, str(tmp_path / "listings.arrow"))
+    snapshot.load()
+    db.calls.clear()
+    return snapshot
+
+
+def prices(snapshot):
+    return snapshot.df.set_index("listing_id")["price"].sort_index().to_dict()
+
+
+def test_first_load_builds_the_snapshot(db, snapshot):
+    assert prices(snapshot) == {1: 1e6, 2: 2e6, 3: 3e6}
+    assert snapshot.version["checked_at"] == 100.0
+    assert (snapshot.df["price_per_sqm"] == snapshot.df["price"] / 100).all()
+
+
+def test_unchanged_version_is_not_synced(db, snapshot):
+    db.now = 200.0
+    assert not snapshot.check()
+    assert db.calls == []
+
+
+def test_sync_applies_updates_and_inserts(db, snapshot):
+    db.now = 200.0
+    db.upsert(2, 2.5e6)
+    db.upsert(4, 4e6)
+    assert snapshot.check()
+    assert db.calls == [("delta", 100.0)]
+    assert prices(snapshot) == {1: 1e6, 2: 2.5e6, 3: 3e6, 4: 4e6}
+    assert snapshot.version["checked_at"] == 200.0
+
+
+def test_sync_removes_deleted_listings(db, snapshot):
+    db.now = 200.0
+    db.delete(1)
+    db.upsert(3, 3.5e6)
+    assert snapshot.check()
+    assert db.calls == [("delta", 100.0), "ids"]
+    assert prices(snapshot) == {2: 2e6, 3: 3.5e6}
+
+
+def test_sync_rebuilds_when_rows_are_missed(db, snapshot):
+    db.now = 200.0
+    # committed late, with an updated_at older than the previous watermark
+    db.upsert(5, 5e6, updated_at=50.0)
+    assert snapshot.check()
+    assert db.calls == [("delta", 100.0), "ids", "full"]
+    assert prices(snapshot) == {1: 1e6, 2: 2e6, 3: 3e6, 5: 5e6}
+
+
+def test_new_process_syncs_from_the_snapshot_file(db, snapshot, tmp_path):
+    db.now = 200.0
+    db.upsert(4, 4e6)
+
+    restarted = ListingsSnapshot(db, snapshot.path)
+    assert restarted.check()
+    assert db.calls == [("delta", 100.0)]
+    assert prices(restarted) == {1: 1e6, 2: 2e6, 3: 3e6, 4: 4e6}
+
+
+def test_concurrent_writers_use_their_own_tmp_file(db, snapshot, monkeypatch):
+    written = []
+    write_feather = feather.write_feather
+
+    def record(table, path, **kwargs):
+        written.append(path)
+        write_feather(table, path, **kwargs)
+
+    monkeypatch.setattr(feather, "write_feather", record)
+    snapshot.write(snapshot.df, snapshot.version)
+    monkeypatch.setattr(os, "getpid", lambda: 1)
+    snapshot.write(snapshot.df, snapshot.version)
+
+    assert written[0] != written[1]
+    assert not any(os.path.exists(path) for path in written)
+    assert snapshot.read_version() == snapshot.version
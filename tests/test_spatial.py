@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from spatial import SpatialIndex
+from store import ListingsStore
+
+
+class FakeSnapshot:
+    def __init__(self, df):
+        self.df = df
+
+    def load(self):
+        return self.df
+
+
+def listings(latitudes, longitudes):
+    n_rows = len(latitudes)
+    return pd.DataFrame(
+        {
+            "listing_id": np.arange(n_rows),
+            "region_name": ["Batangas"] * n_rows,
+            "city_name": ["Lipa"] * n_rows,
+            "price": np.arange(n_rows, dtype=float) * 1e6 + 1e6,
+            "price_per_sqm": np.full(n_rows, 1e4),
+            "latitude": latitudes,
+            "longitude": longitudes,
+        }
+    )
+
+
+def test_nearest_and_radius():
+    index = SpatialIndex([14.0, 14.01, np.nan, 15.0], [121.0, 121.0, 121.0, 121.0])
+    positions, distances = index.nearest(14.0, 121.0, k=2)
+    assert positions.tolist() == [0, 1]
+    assert 1.0 < distances[1] < 1.2
+    positions, _ = index.within_radius(14.0, 121.0, radius_km=5)
+    assert positions.tolist() == [0, 1]
+
+
+def test_empty_index_finds_nothing():
+    for latitudes, longitudes in (([], []), ([np.nan, np.nan], [121.0, np.nan])):
+        index = SpatialIndex(latitudes, longitudes)
+        assert len(index.nearest(14.0, 121.0, k=5)[0]) == 0
+        assert len(index.within_radius(14.0, 121.0, radius_km=5)[0]) == 0
+
+
+def test_unknown_point_finds_nothing():
+    index = SpatialIndex([14.0], [121.0])
+    assert len(index.nearest(np.nan, np.nan, k=5)[0]) == 0
+    assert len(index.within_radius(np.nan, 121.0, radius_km=5)[0]) == 0
+
+
+def test_store_without_coordinates():
+    store = ListingsStore(FakeSnapshot(listings([np.nan, np.nan], [np.nan, np.nan])))
+    assert store.nearby_listings(14.0, 121.0, radius_km=5).empty
+    assert store.nearby_listings(14.0, 121.0).empty
+
+
+def test_store_nearest_by_default():
+    store = ListingsStore(FakeSnapshot(listings([14.0, 14.01, 15.0], [121.0] * 3)))
+    nearby = store.nearby_listings(14.0, 121.0)
+    assert len(nearby) == 3
+    assert nearby["price"].is_monotonic_increasing
+    assert "distance_km" in nearby
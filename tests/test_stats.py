@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import fx
+from stats import MAX_OUTLIERS, PRICE_STATS, StatsCube, summarize, summarize_outliers
+
+
+@pytest.fixture
+def listings():
+    rng = np.random.default_rng(7)
+    batangas = np.r_[rng.normal(5e6, 1e6, 40), [2e7, 2.5e7, 1e5]]
+    manila = rng.normal(1.2e7, 3e6, 25)
+    cebu = np.r_[rng.normal(8e6, 5e5, 300), np.linspace(5e7, 1e8, 60)]
+    df = pd.DataFrame(
+        {
+            "region_name": ["Batangas"] * len(batangas)
+            + ["Metro Manila"] * len(manila)
+            + ["Cebu"] * len(cebu),
+            "city_name": ["Lipa"] * 20
+            + ["Tanauan"] * (len(batangas) - 20)
+            + ["San Juan"] * len(manila)
+            + ["Cebu City"] * len(cebu),
+            "price": np.r_[batangas, manila, cebu],
+        }
+    )
+    df["price_per_sqm"] = df["price"] / rng.uniform(50, 300, len(df))
+    return df
+
+
+@pytest.fixture
+def usd_rate(monkeypatch):
+    provider = fx.RateProvider(fx.StaticRateSource({("PHP", "USD"): 0.02}), path=None)
+    monkeypatch.setattr(fx, "_provider", provider)
+    return 0.02
+
+
+def expected_stats(values):
+    """Box plot statistics of a group computed directly with NumPy"""
+    values = np.asarray(values)
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {
+        "count": len(values),
+        "mean": values.mean(),
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "lower_whisker": inside.min(),
+        "upper_whisker": inside.max(),
+        "outliers": values[(values < inside.min()) | (values > inside.max())],
+    }
+
+
+@pytest.mark.parametrize("value_col", ["price", "price_per_sqm"])
+def test_group_statistics_match_numpy(listings, value_col):
+    keys = ["region_name", "city_name"]
+    stats = summarize(listings, keys, value_col)
+    outliers = summarize_outliers(listings, keys, value_col, stats)
+    for (region, city), group in listings.groupby(keys):
+        expected = expected_stats(group[value_col])
+        row = stats.loc[(region, city)]
+        for name, value in expected.items():
+            if name != "outliers":
+                assert row[name] == pytest.approx(value), (region, city, name)
+
+        found = outliers.loc[
+            (outliers["region_name"] == region) & (outliers["city_name"] == city),
+            value_col,
+        ]
+        expected_outliers = np.sort(expected["outliers"])
+        if len(expected_outliers) > MAX_OUTLIERS:
+            continue
+        assert np.sort(found.to_numpy()) == pytest.approx(expected_outliers)
+
+
+def test_outliers_are_capped_to_the_most_extreme(listings):
+    stats = summarize(listings, ["region_name"], "price")
+    outliers = summarize_outliers(listings, ["region_name"], "price", stats)
+    cebu = outliers.loc[outliers["region_name"] == "Cebu", "price"]
+
+    # Cebu has 60 high outliers, only the 50 furthest from the median are kept
+    assert len(cebu) == MAX_OUTLIERS
+    assert sorted(cebu) == pytest.approx(sorted(np.linspace(5e7, 1e8, 60))[-50:])
+    assert cebu.is_monotonic_decreasing
+
+    # Groups with fewer outliers keep all of them
+    batangas = listings.loc[listings["region_name"] == "Batangas", "price"]
+    expected = expected_stats(batangas)["outliers"]
+    assert 3 <= len(expected) < MAX_OUTLIERS
+    assert (outliers["region_name"] == "Batangas").sum() == len(expected)
+
+
+def test_cube_converts_each_query(listings, usd_rate):
+    cube = StatsCube(listings)
+    base = cube.city_stats("price")
+    base_copy = base.copy()
+
+    usd = cube.city_stats("price", "USD")
+    assert usd[PRICE_STATS].to_numpy() == pytest.approx(
+        base[PRICE_STATS].to_numpy() * usd_rate
+    )
+    assert (usd["count"] == base["count"]).all()
+
+    region = cube.city_stats("price", "USD", region="Batangas")
+    assert region.index.tolist() == ["Lipa", "Tanauan"]
+
+    outliers = cube.region_outliers("price", "USD")
+    base_outliers = cube.region_outliers("price")
+    assert outliers["price"].to_numpy() == pytest.approx(
+        base_outliers["price"].to_numpy() * usd_rate
+    )
+
+    # The stored statistics stay in the base currency
+    pd.testing.assert_frame_equal(cube.city_stats("price"), base_copy)